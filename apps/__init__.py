@@ -27,42 +27,139 @@ __license__ = "GPLv3"
 __status__ = "Production"
 __version__ = "1.0.0"
 
+import os
+import threading
+import time
+
+import click
 from flask import Flask
+from flask import request
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from importlib import import_module
 
+from apps.utils import compression_utils
+
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 
 
 def register_extensions(app):
+
+    # Bound the time spent connecting to the PostgreSQL database
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+        engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        engine_options['connect_args'] = dict(engine_options.get('connect_args', {}),
+                                              connect_timeout=int(os.getenv('POSTGRES_CONNECT_TIMEOUT', 10)))
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
     db.init_app(app)
     login_manager.init_app(app)
+    compression_utils.init_app(app)
 
 
 def register_blueprints(app):
-    for module_name in ('auth', 'home', 'rest', 'rest.interfaces', 'rest.processors', 'rest.services'):
+    for module_name in ('auth', 'home', 'health', 'rest', 'rest.interfaces', 'rest.processors', 'rest.services',
+                        'rest.documents'):
         module = import_module('apps.routes.{}.routes'.format(module_name))
         app.register_blueprint(module.blueprint)
 
 
 def configure_database(app):
 
-    with app.app_context():
-        # def initialize_database():
-        db.create_all()
+    # Only the connection parameters are set here: the connection is established upon the first use
+    from apps.connector.MongoConnector import MongoConnector
+    MongoConnector().connect(app.config['MONGO_HOST'], app.config['MONGO_PORT'], app.config['MONGO_DB_USERNAME'],
+                             app.config['MONGO_DB_PASSWORD'])
+
+    # The databases are initialized upon the first request, rather than when the application is created, so that
+    # the workers boot without waiting for the databases; the health probes do not trigger the initialization
+    startup = {'done': False, 'last_attempt': None, 'lock': threading.Lock()}
+
+    @app.before_request
+    def initialize_on_first_request():
+        if startup['done'] or request.blueprint == 'health_blueprint':
+            return
+        with startup['lock']:
+            last_attempt = startup['last_attempt']
+            if startup['done'] or (last_attempt is not None and
+                                   time.monotonic() - last_attempt < app.config['STARTUP_RETRY_INTERVAL']):
+                return
+            startup['last_attempt'] = time.monotonic()
+            try:
+                initialize_databases(app)
+                startup['done'] = True
+            except Exception as ex:
+                app.logger.error('Unable to initialize the databases: ' + str(ex))
 
     @app.teardown_request
     def shutdown_session(exception=None):
         db.session.remove()
 
 
+def initialize_databases(app):
+    """
+    Create the missing Postgres tables, the Mongo database and the Mongo indexes.
+    """
+    db.create_all()
+
+    from apps.connector.MongoConnector import MongoConnector
+    connection = MongoConnector().get_connection()
+    if app.config['MONGO_DB_NAME'] not in connection.list_database_names():
+        connection[app.config['MONGO_DB_NAME']].customers.insert_one({"user_id": 1, "user": "test"})
+
+    # Create the indexes of the Mongo collections, if missing
+    from apps.models.nosql.BaseDocument import BaseDocument
+    import apps.models.nosql.Graph
+    try:
+        BaseDocument.ensure_all_indexes()
+    except Exception as ex:
+        app.logger.warning('Unable to ensure the Mongo indexes: ' + str(ex))
+
+
+def register_commands(app):
+
+    @app.cli.command('init-databases')
+    def init_databases():
+        """Create the database tables, the Mongo database and the Mongo indexes."""
+        initialize_databases(app)
+        print('Databases initialized')
+
+    @app.cli.command('migrate-graphs')
+    def migrate_graphs():
+        """Convert the stored configuration graphs from JSON strings to native subdocuments."""
+        from apps.models.nosql.Graph import Graph
+        migrated = Graph().migrate_storage()
+        print('Migrated {} configuration graph documents'.format(migrated))
+
+    @app.cli.command('compress-static')
+    def compress_static():
+        """Write the precompressed (.gz, .br) copies of the static files."""
+        written = compression_utils.compress_static(app.static_folder)
+        print('Written {} precompressed static files'.format(written))
+
+    @app.cli.command('ensure-indexes')
+    @click.option('--check', is_flag=True, help='Report the queries which would be resolved with a collection scan.')
+    def ensure_indexes(check):
+        """Create the declared indexes of the Mongo collections."""
+        from apps.models.nosql.BaseDocument import BaseDocument
+        import apps.models.nosql.Graph
+        for collection_name, indexes in BaseDocument.ensure_all_indexes().items():
+            print('{}: {}'.format(collection_name, ', '.join(indexes)))
+        if check:
+            collscans = BaseDocument.check_all_indexes()
+            for collscan in collscans:
+                print('COLLSCAN ' + collscan)
+            if not collscans:
+                print('No collection scan detected')
+
+
 def create_app(config):
     app = Flask(__name__)
     app.config.from_object(config)
     register_extensions(app)
     register_blueprints(app)
+    register_commands(app)
     configure_database(app)
     return app
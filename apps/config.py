@@ -28,7 +28,6 @@ __status__ = "Production"
 __version__ = "1.0.0"
 
 import os
-from apps.connector.MongoConnector import MongoConnector
 
 
 class Config(object):
@@ -70,14 +69,9 @@ class Config(object):
     MONGO_DB_USERNAME = os.getenv('MONGO_DB_USERNAME', 'configuration_tool')
     MONGO_DB_PASSWORD = os.getenv('MONGO_DB_PASSWORD', '3sMUk6XCc9eSDhPCPfWPB2CMWBXc4SyZ')
 
-    mongo = MongoConnector()
-    mongo.connect(MONGO_HOST, MONGO_PORT, MONGO_DB_USERNAME, MONGO_DB_PASSWORD)
-    dbs = mongo.get_connection().list_database_names()
-    if MONGO_DB_NAME not in dbs:
-        db = mongo.get_connection()[MONGO_DB_NAME]
-        collection = db.customers
-        document = {"user_id": 1, "user": "test"}
-        collection.insert_one(document)
+    # Interval, in seconds, between two attempts of the startup phase (database schema, seeding and indexes), if the
+    # databases are not reachable
+    STARTUP_RETRY_INTERVAL = int(os.getenv('STARTUP_RETRY_INTERVAL', 30))
 
     # Assets Management
     ASSETS_ROOT = os.getenv('ASSETS_ROOT', '/static/assets')    
@@ -115,9 +109,6 @@ class ProductionConfig(Config):
     MONGO_DB_USERNAME = os.getenv('MONGO_DB_USERNAME', 'configuration_tool')
     MONGO_DB_PASSWORD = os.getenv('MONGO_DB_PASSWORD', '3sMUk6XCc9eSDhPCPfWPB2CMWBXc4SyZ')
 
-    mongo = MongoConnector()
-    mongo.connect(MONGO_HOST, MONGO_PORT, MONGO_DB_USERNAME, MONGO_DB_PASSWORD)
-
     # Assets Management
     ASSETS_ROOT = os.getenv('ASSETS_ROOT', '/static/assets')
 
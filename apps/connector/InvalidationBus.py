@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+import logging
+import os
+import threading
+import time
+
+import pymongo
+
+from apps.connector.MongoConnector import MongoConnector
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus(object):
+    """
+    Propagate the invalidation of cached data across processes (e.g. the gunicorn workers) and hosts.
+    Every write of cached data is published by bumping a watermark document, identified by the namespace (e.g. the
+    collection name) and the key (e.g. the document ID) of the written data, and numbered with a global sequence.
+    In each process, a background thread follows the watermarks and calls the callbacks subscribed to the namespace,
+    so that the cached data is dropped within a bounded delay. The watermarks are followed with a change stream, if
+    the MongoDB deployment supports it (replica set), or by polling the watermarks collection otherwise.
+    The following environment variables configure the bus:
+    - CACHE_INVALIDATION_MODE: 'auto' (change stream, falling back to polling), 'watch', 'poll' or 'off'
+    - CACHE_INVALIDATION_INTERVAL: polling interval in seconds (default: 1)
+    """
+
+    # The key invalidating a whole namespace
+    ALL = '*'
+
+    # Number of sequence numbers re-read by each poll, to catch the watermarks committed out of sequence order
+    WINDOW = 1000
+
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(InvalidationBus, cls).__new__(cls)
+            cls.instance.subscribers = {}
+            cls.instance.lock = threading.Lock()
+            cls.instance.thread = None
+            cls.instance.pid = None
+
+            # Whether the publication and the following of the watermarks are failing: the failures are logged once
+            # per streak
+            cls.instance.publish_failing = False
+            cls.instance.follow_failing = False
+        return cls.instance
+
+    def get_collection(self):
+        return MongoConnector().get_collection(os.getenv('MONGO_DB_NAME', 'configuration_tool_db'), 'watermarks')
+
+    def get_mode(self):
+        return os.getenv('CACHE_INVALIDATION_MODE', 'auto')
+
+    def subscribe(self, namespace, callback):
+        """
+        Register a callback, called with the invalidated key, or with None if the whole namespace is invalidated.
+        :param namespace: the namespace
+        :param callback: the callback
+        """
+        with self.lock:
+            self.subscribers.setdefault(namespace, []).append(callback)
+
+    def publish(self, namespace, key=None):
+        """
+        Notify the other processes that the data with the given key has been written. Failures are logged and
+        otherwise ignored, as the caches also expire after a while.
+        :param namespace: the namespace
+        :param key: the key of the written data, or None if unknown
+        """
+        if self.get_mode() == 'off':
+            return
+        try:
+            counter = MongoConnector().get_collection(os.getenv('MONGO_DB_NAME', 'configuration_tool_db'),
+                                                      'counters').find_one_and_update(
+                {'_id': 'watermarks'}, {'$inc': {'seq': 1}}, upsert=True, return_document=pymongo.ReturnDocument.AFTER)
+            key = key if key is not None else self.ALL
+            self.get_collection().update_one({'_id': namespace + ':' + key},
+                                             {'$set': {'namespace': namespace, 'key': key},
+                                              '$max': {'seq': counter['seq']}}, upsert=True)
+            self.publish_failing = False
+        except Exception:
+            if not self.publish_failing:
+                self.publish_failing = True
+                logger.exception('Unable to publish the cache invalidations: the other processes keep their cached '
+                                 'data until it expires')
+
+    def start(self):
+        """
+        Start following the watermarks in the current process, if not yet started; the thread is started again in
+        forked processes, which do not inherit it.
+        """
+        if self.get_mode() == 'off' or (self.pid == os.getpid() and self.thread is not None and
+                                        self.thread.is_alive()):
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread is not None and self.thread.is_alive():
+                return
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.__run, name='cache-invalidation', daemon=True)
+            self.thread.start()
+
+    def __run(self):
+        mode = self.get_mode()
+        while True:
+            try:
+                # Any invalidation might have been missed before (re)starting to follow the watermarks
+                self.__dispatch_all()
+                if mode in ('auto', 'watch'):
+                    try:
+                        self.__watch()
+                    except pymongo.errors.OperationFailure:
+                        # Change streams are not supported by standalone servers
+                        if mode == 'watch':
+                            raise
+                        mode = 'poll'
+                        continue
+                else:
+                    self.__poll()
+            except Exception:
+                if not self.follow_failing:
+                    self.follow_failing = True
+                    logger.exception('Unable to follow the cache invalidations: the cached data is kept until it '
+                                     'expires')
+                time.sleep(float(os.getenv('CACHE_INVALIDATION_INTERVAL', 1)))
+
+    def __watch(self):
+        with self.get_collection().watch([{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}}]) \
+                as stream:
+            self.follow_failing = False
+            for change in stream:
+                self.__dispatch(change['documentKey']['_id'])
+
+    def __poll(self):
+        collection = self.get_collection()
+        collection.create_index([('seq', pymongo.ASCENDING)])
+        last = collection.find_one({}, {'seq': 1}, sort=[('seq', pymongo.DESCENDING)])
+        start = last['seq'] if last is not None else 0
+        high = start
+        seen = {}
+        while True:
+            time.sleep(float(os.getenv('CACHE_INVALIDATION_INTERVAL', 1)))
+            for watermark in collection.find({'seq': {'$gt': high - self.WINDOW}}, {'seq': 1}):
+                if watermark['seq'] > seen.get(watermark['_id'], start):
+                    seen[watermark['_id']] = watermark['seq']
+                    self.__dispatch(watermark['_id'])
+                high = max(high, watermark['seq'])
+            self.follow_failing = False
+            seen = {key: seq for key, seq in seen.items() if seq > high - self.WINDOW}
+
+    def __dispatch(self, watermark_id):
+        namespace, key = watermark_id.split(':', 1)
+        for callback in self.subscribers.get(namespace, []):
+            callback(None if key == self.ALL else key)
+
+    def __dispatch_all(self):
+        for namespace, callbacks in list(self.subscribers.items()):
+            for callback in callbacks:
+                callback(None)
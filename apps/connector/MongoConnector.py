@@ -27,42 +27,184 @@ __license__ = "GPLv3"
 __status__ = "Production"
 __version__ = "1.0.0"
 
+import os
+import threading
+import time
+
 from pymongo import MongoClient
+from pymongo import monitoring
+
+
+class PoolStatistics(monitoring.ConnectionPoolListener):
+    """
+    Collect the statistics of the connection pool of a MongoClient: the number of connections currently checked out,
+    the number of check-outs (failed or not) and the time spent waiting for a connection.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.connections = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def get_stats(self):
+        with self.__lock:
+            return {
+                'connections': self.connections,
+                'checked_out': self.checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'wait_time_ms': round(self.wait_time * 1000, 3),
+                'max_wait_time_ms': round(self.max_wait_time * 1000, 3),
+                'avg_wait_time_ms': round(self.wait_time * 1000 / self.checkouts, 3) if self.checkouts else 0.0
+            }
+
+    def __end_wait(self, failed):
+        started = getattr(self.__local, 'started', None)
+        self.__local.started = None
+        wait = time.monotonic() - started if started is not None else 0.0
+        with self.__lock:
+            self.checkouts += 1
+            self.wait_time += wait
+            self.max_wait_time = max(self.max_wait_time, wait)
+            if failed:
+                self.checkout_failures += 1
+            else:
+                self.checked_out += 1
+
+    def connection_check_out_started(self, event):
+        self.__local.started = time.monotonic()
+
+    def connection_check_out_failed(self, event):
+        self.__end_wait(True)
+
+    def connection_checked_out(self, event):
+        self.__end_wait(False)
+
+    def connection_checked_in(self, event):
+        with self.__lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self.__lock:
+            self.connections += 1
+
+    def connection_closed(self, event):
+        with self.__lock:
+            self.connections -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
 
 
 class MongoConnectorSingleton(object):
+    """
+    The connector to the MongoDB server, shared by the whole process.
+    The MongoClient is not fork-safe: it is therefore created lazily, upon the first use, and created again if the
+    process has been forked in the meantime (e.g. by the gunicorn master process), so that each worker owns its
+    connection pool. The pool is configured with the following environment variables:
+    - MONGO_MAX_POOL_SIZE: maximum number of connections (default: 100)
+    - MONGO_MIN_POOL_SIZE: number of connections kept open (default: 0)
+    - MONGO_WAIT_QUEUE_TIMEOUT_MS: maximum wait for a free connection (default: unlimited)
+    - MONGO_SERVER_SELECTION_TIMEOUT_MS: maximum wait for an available server (default: 30000)
+    - MONGO_CONNECT_TIMEOUT_MS: timeout of the connection to the server (default: 20000)
+    - MONGO_COMPRESSORS: comma-separated wire protocol compressors, e.g. 'zstd,zlib' (default: none)
+    """
 
     def __new__(cls):
         if not hasattr(cls, 'instance'):
             cls.instance = super(MongoConnectorSingleton, cls).__new__(cls)
+            cls.instance.connection = None
+            cls.instance.pid = None
+            cls.instance.collections = {}
+            cls.instance.statistics = PoolStatistics()
+            cls.instance.lock = threading.RLock()
         return cls.instance
 
     def connect(self, hostname, port, username, password):
+        """
+        Set the connection parameters; the connection is established upon the first use.
+        """
         if not isinstance(port, int):
             port = int(port)
         self.hostname = hostname
         self.port = port
         self.username = username
         self.password = password
-        self.connection = None
-        return self.reconnect()
+        self.close()
+        return None
 
     def reconnect(self):
-        if self.connection is not None and self.connection.options.connect:
-            self.connection.close()
-            self.connection = None
-        self.connection = MongoClient(self.hostname, self.port, username=self.username, password=self.password)
+        with self.lock:
+            self.close()
+            options = {
+                'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+                'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),
+                'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000)),
+                'connectTimeoutMS': int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 20000))
+            }
+            if os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS'):
+                options['waitQueueTimeoutMS'] = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS'))
+            if os.getenv('MONGO_COMPRESSORS'):
+                options['compressors'] = os.getenv('MONGO_COMPRESSORS')
+            self.statistics = PoolStatistics()
+            self.connection = MongoClient(self.hostname, self.port, username=self.username, password=self.password,
+                                          event_listeners=[self.statistics], **options)
+            self.pid = os.getpid()
         return self.connection
 
     def get_connection(self):
-        if self.connection is None or not self.connection.options.connect:
-            self.connection = self.reconnect()
+        if self.connection is None or self.pid != os.getpid():
+
+            # Only the first of the threads racing for the connection establishes it
+            with self.lock:
+                if self.connection is None or self.pid != os.getpid():
+                    self.reconnect()
         return self.connection
 
-    def __del__(self):
-        if self.connection is not None:
+    def get_collection(self, db_name, collection_name):
+        """
+        Return the handle of the given collection, cached for the lifetime of the connection.
+        """
+        connection = self.get_connection()
+        key = (db_name, collection_name)
+        cached = self.collections.get(key)
+        if cached is None or cached[0] is not connection:
+            cached = (connection, connection[db_name][collection_name])
+            self.collections[key] = cached
+        return cached[1]
+
+    def get_pool_stats(self):
+        """
+        Return the statistics of the connection pool of the current process.
+        """
+        stats = self.statistics.get_stats()
+        stats['pid'] = self.pid
+        return stats
+
+    def close(self):
+        # A client inherited from the parent process must not be closed, as it is still in use by the parent
+        if self.connection is not None and self.pid == os.getpid():
             self.connection.close()
-            self.connection = None
+        self.connection = None
+        self.pid = None
+        self.collections = {}
         return
 
 
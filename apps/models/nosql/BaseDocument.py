@@ -27,34 +27,170 @@ __license__ = "GPLv3"
 __status__ = "Production"
 __version__ = "1.0.0"
 
+from apps.connector.InvalidationBus import InvalidationBus
 from apps.connector.MongoConnector import MongoConnector
 import pymongo
 import apps.utils.auth_utils as utils
+import apps.utils.diff_utils as diff_utils
+import copy
 import json
 import datetime
 
 
 class BaseDocument:
 
+    # Fields of the versioned records which are not part of the versioned content
+    VERSION_METADATA = ('_id', 'id', 'n_ver', 'tag', 'comment', 'last_modify', 'delta')
+
+    # Indexes of the document collection and of its version control collection, declared by the subclasses as
+    # (keys, options) pairs, where the keys are lists of (field, direction) pairs
+    INDEXES = []
+    VERSION_CONTROL_INDEXES = []
+
+    # Representative queries, as (filter, sort) pairs, which are expected to be served by the declared indexes
+    QUERIES = []
+    VERSION_CONTROL_QUERIES = []
+
+    # The registered document classes
+    REGISTRY = []
+
+    # Whether the writes are published on the invalidation bus, for the classes caching documents across requests
+    PUBLISH_WRITES = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        BaseDocument.REGISTRY.append(cls)
+
     def __init__(self):
         import os
         self.MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'configuration_tool_db')
         self.COLLECTION_NAME = type(self).__name__
         self.COLLECTION_NAME_VERSION_CONTROL = self.COLLECTION_NAME + '_version_control'
+        self.COLLECTION_NAME_COUNTERS = 'counters'
+
+        # A full copy of the document is stored every VERSION_CHECKPOINT_INTERVAL versions; the other versions are
+        # stored as the difference with respect to the previous one
+        self.VERSION_CHECKPOINT_INTERVAL = int(os.getenv('VERSION_CHECKPOINT_INTERVAL', 10))
         return
 
+    @staticmethod
+    def ensure_all_indexes():
+        """
+        Create the declared indexes of all the registered document classes.
+        :return: the names of the indexes, by collection
+        :rtype: dict
+        """
+        indexes = {}
+        for cls in BaseDocument.REGISTRY:
+            indexes.update(cls().ensure_indexes())
+        return indexes
+
+    @staticmethod
+    def check_all_indexes():
+        """
+        :return: the representative queries of all the registered document classes which are resolved with a
+            collection scan
+        :rtype: list
+        """
+        collscans = []
+        for cls in BaseDocument.REGISTRY:
+            collscans += cls().check_indexes()
+        return collscans
+
+    def ensure_indexes(self):
+        """
+        Create the declared indexes; the operation is idempotent, as existing indexes are left untouched.
+        :return: the names of the indexes, by collection
+        :rtype: dict
+        """
+        indexes = {}
+        for collection_name, declared, queries in self.index_declarations():
+            collection = MongoConnector().get_collection(self.MONGO_DB_NAME, collection_name)
+            indexes[collection_name] = []
+            for keys, options in declared:
+                try:
+                    name = collection.create_index(keys, **options)
+                except pymongo.errors.OperationFailure as ex:
+
+                    # An index with the same keys but different options exists: replace it
+                    if ex.code not in (85, 86):
+                        raise
+                    collection.drop_index(keys)
+                    name = collection.create_index(keys, **options)
+                indexes[collection_name].append(name)
+        return indexes
+
+    def index_declarations(self):
+        """
+        :return: the collections of the document class, with their declared indexes and representative queries
+        :rtype: list
+        """
+        return [(self.COLLECTION_NAME, self.INDEXES, self.QUERIES),
+                (self.COLLECTION_NAME_VERSION_CONTROL, self.VERSION_CONTROL_INDEXES, self.VERSION_CONTROL_QUERIES)]
+
+    def check_indexes(self):
+        """
+        Explain the representative queries, and report the ones whose winning plan is a collection scan.
+        :return: the descriptions of the queries resolved with a collection scan
+        :rtype: list
+        """
+        collscans = []
+        for collection_name, declared, queries in self.index_declarations():
+            collection = MongoConnector().get_collection(self.MONGO_DB_NAME, collection_name)
+            for query, sort in queries:
+                cursor = collection.find(query)
+                if sort is not None:
+                    cursor = cursor.sort(sort)
+                plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+                if self.__has_stage(plan, 'COLLSCAN'):
+                    collscans.append('{}: find({}) sort({})'.format(collection_name, query, sort))
+        return collscans
+
+    def __has_stage(self, plan, stage):
+        if plan.get('stage') == stage:
+            return True
+        children = [plan[key] for key in ('inputStage', 'queryPlan') if key in plan]
+        children += plan.get('inputStages', [])
+        return any(self.__has_stage(child, stage) for child in children)
+
     def find(self, query=None):
         cursor = None
         if query is not None:
-            cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME].find(query)
+            cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).find(query)
         else:
-            cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME].find()
+            cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).find()
 
         list_obj = list()
         for x in cursor:
             list_obj.append(dict(x))
         return list_obj
 
+    def iter_find(self, query=None, projection=None, sort=None, limit=0, batch_size=100):
+        """
+        Iterate over the documents matching the query, fetching them from the database in batches, instead of
+        loading the whole result in memory.
+        :param query: the filter selecting the documents
+        :param projection: the fields to be retrieved
+        :param sort: the sort specification, as list of (field, direction) pairs
+        :param limit: the maximum number of documents (0 for no limit)
+        :param batch_size: the number of documents fetched per round-trip
+        :return: a generator of documents
+        """
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).find(
+            query if query is not None else {}, projection, sort=sort, limit=limit, batch_size=batch_size)
+        try:
+            for x in cursor:
+                yield dict(x)
+        finally:
+            cursor.close()
+
+    def find_one(self, query, projection=None):
+        document = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).find_one(query,
+                                                                                                        projection)
+        if document is None:
+            return None
+        return dict(document)
+
     def insert(self, document):
         ret = None
         if isinstance(document, list):
@@ -67,7 +203,8 @@ class BaseDocument:
         if not isinstance(document, dict):
             document = document.__dict__
         document['last_modify'] = datetime.datetime.utcnow()
-        cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME].insert_one(document)
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).insert_one(document)
+        self.__written({'id': document.get('id')})
         return cursor
 
     def insert_many(self, documents):
@@ -81,15 +218,18 @@ class BaseDocument:
                 else:
                     document['last_modify'] = datetime.datetime.utcnow()
                     to_insert.append(document)
-        cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME].insert_many(to_insert)
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).insert_many(to_insert)
+        self.__written(None)
         return cursor
 
     def delete_one(self, query):
-        cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME].delete_one(query)
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).delete_one(query)
+        self.__written(query)
         return cursor
 
     def delete_many(self, query):
-        cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME].delete_many(query)
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).delete_many(query)
+        self.__written(query)
         return cursor
 
     def update_one(self, query, newvalue):
@@ -97,7 +237,8 @@ class BaseDocument:
             newvalue = json.dumps(newvalue.__dict__, cls=utils.AlchemyEncoder)
         newvalue['last_modify'] = datetime.datetime.utcnow()
         newvalue = {"$set": newvalue}
-        cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME].update_one(query, newvalue)
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).update_one(query, newvalue)
+        self.__written(query)
         return cursor
 
     def update_many(self, query, newvalue):
@@ -105,10 +246,45 @@ class BaseDocument:
             newvalue = json.dumps(newvalue.__dict__, cls=utils.AlchemyEncoder)
         newvalue['last_modify'] = datetime.datetime.utcnow()
         newvalue = {"$set": newvalue}
-        cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME].update_many(query,
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).update_many(query,
                                                                                                          newvalue)
+        self.__written(query)
         return cursor
 
+    def find_one_and_update(self, query, update, array_filters=None, projection=None):
+        """
+        Apply the update operators to the first document matching the query, and return the updated document.
+        :param query: the filter selecting the document
+        :param update: the update operators (e.g. $set, $push, $pull)
+        :param array_filters: the filters of the $[<identifier>] positional operators, if any
+        :param projection: the fields of the updated document to be returned
+        :return: the updated document, or None if no document matches the query
+        :rtype: dict
+        """
+        update = dict(update)
+        update['$set'] = dict(update.get('$set', {}))
+        update['$set']['last_modify'] = datetime.datetime.utcnow()
+        document = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).find_one_and_update(
+            query, update, projection=projection, array_filters=array_filters,
+            return_document=pymongo.ReturnDocument.AFTER)
+        if document is None:
+            return None
+        self.__written(query)
+        return dict(document)
+
+    def invalidate(self, query):
+        """
+        Called after every write on the collection, so that subclasses caching documents can drop the affected ones.
+        :param query: the filter selecting the written documents, or None if unknown
+        """
+        pass
+
+    def __written(self, query):
+        self.invalidate(query)
+        if self.PUBLISH_WRITES:
+            key = query.get('id') if query is not None else None
+            InvalidationBus().publish(self.COLLECTION_NAME, key if isinstance(key, str) else None)
+
     def versioning(self, idScenario, tag, message):
         try:
             if idScenario is None or len(idScenario) == 0:
@@ -122,23 +298,9 @@ class BaseDocument:
             if message is None:
                 message = ''
 
-            query = {'id': idScenario}
-            sort = [('n_ver', pymongo.DESCENDING)]
-            n_ver = -1
-            cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME_VERSION_CONTROL].find(
-                query).sort(sort).limit(1)
-            record_versioned = None
-            for x in cursor:
-                record_versioned = x
-                break
-            if record_versioned is None or len(record_versioned) == 0:
-                n_ver = 1
-            else:
-                n_ver = int(record_versioned['n_ver']) + 1
-
             query = {'id': idScenario}
             sort = [('last_modify', pymongo.DESCENDING)]
-            cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME].find(query).sort(
+            cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME).find(query).sort(
                 sort).limit(1)
             record = None
             for x in cursor:
@@ -148,31 +310,210 @@ class BaseDocument:
                 return None
 
             del record['_id']
+
+            if not isinstance(record, dict):
+                record = record.__dict__
+
+            n_ver = self.allocate_version(idScenario)
+
+            # Unless a checkpoint is due, store only the changes with respect to the previous version
+            if (n_ver - 1) % self.VERSION_CHECKPOINT_INTERVAL != 0:
+                previous = self.history_find({'id': idScenario, 'n_ver': n_ver - 1})
+                if len(previous) > 0:
+                    delta = diff_utils.diff(self.version_content(previous[0]), self.version_content(record))
+                    record = {'id': idScenario, 'delta': delta}
+
             record['n_ver'] = n_ver
             record['tag'] = tag
             record['comment'] = message
             record['last_modify'] = datetime.datetime.utcnow()
 
-            if not isinstance(record, dict):
-                record = record.__dict__
-
-            cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][
-                self.COLLECTION_NAME_VERSION_CONTROL].insert_one(record)
+            cursor = MongoConnector().get_collection(self.MONGO_DB_NAME,
+                                                  self.COLLECTION_NAME_VERSION_CONTROL).insert_one(record)
         except Exception as ex:
             return None
         return cursor
 
+    def allocate_version(self, id):
+        """
+        Atomically allocate the next version number of a document, so that concurrent commits never share the same
+        version number. The counter is initialized from the existing versions, if any, the first time it is used.
+        :param id: the document ID
+        :return: the allocated version number
+        :rtype: int
+        """
+        counters = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_COUNTERS)
+        key = self.COLLECTION_NAME_VERSION_CONTROL + ':' + id
+        counter = counters.find_one_and_update({'_id': key}, {'$inc': {'seq': 1}},
+                                               return_document=pymongo.ReturnDocument.AFTER)
+        if counter is None:
+            last = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_VERSION_CONTROL).find_one(
+                {'id': id}, {'n_ver': 1}, sort=[('n_ver', pymongo.DESCENDING)])
+            counters.update_one({'_id': key}, {'$max': {'seq': int(last['n_ver']) if last is not None else 0}},
+                                upsert=True)
+            counter = counters.find_one_and_update({'_id': key}, {'$inc': {'seq': 1}},
+                                                   return_document=pymongo.ReturnDocument.AFTER)
+        return counter['seq']
+
     def history_find(self, query=None, sort=None):
         cursor = None
         if query is not None:
-            cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME_VERSION_CONTROL].find(
+            cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_VERSION_CONTROL).find(
                 query)
             if sort is not None:
                 cursor = cursor.sort(sort)
         else:
-            cursor = MongoConnector().get_connection()[self.MONGO_DB_NAME][self.COLLECTION_NAME_VERSION_CONTROL].find()
+            cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_VERSION_CONTROL).find()
+
+        list_obj = list()
+        for x in cursor:
+            list_obj.append(dict(x))
+        return self.rebuild_versions(list_obj)
+
+    def iter_history(self, query=None, projection=None, sort=None, limit=0, batch_size=100):
+        """
+        Iterate over the versioned records matching the query, fetching them from the database in batches. The
+        delta-encoded records are rebuilt one batch at a time.
+        :param query: the filter selecting the versioned records
+        :param projection: the fields to be retrieved, as list or inclusion dictionary
+        :param sort: the sort specification, as list of (field, direction) pairs
+        :param limit: the maximum number of records (0 for no limit)
+        :param batch_size: the number of records fetched per round-trip
+        :return: a generator of versioned records
+        """
+        fields = None
+        if projection is not None:
+            fields = [field for field in projection if not isinstance(projection, dict) or projection[field]]
+
+            # The delta is needed to rebuild the versioned content fields
+            if any(field not in self.VERSION_METADATA for field in fields):
+                projection = {field: 1 for field in fields + ['id', 'n_ver', 'delta']}
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_VERSION_CONTROL).find(
+            query if query is not None else {}, projection, sort=sort, limit=limit, batch_size=batch_size)
+        try:
+            batch = []
+            for x in cursor:
+                batch.append(dict(x))
+                if len(batch) >= batch_size:
+                    yield from self.__project(self.rebuild_versions(batch), fields)
+                    batch = []
+            yield from self.__project(self.rebuild_versions(batch), fields)
+        finally:
+            cursor.close()
+
+    def __project(self, records, fields):
+        if fields is None:
+            return records
+        return [{key: value for key, value in record.items() if key in fields or key == '_id'} for record in records]
+
+    def history_list(self, id, after_n_ver=None, limit=0):
+        """
+        List the versions of a document, most recent first, without their content.
+        :param id: the document ID
+        :param after_n_ver: if set, only the versions preceding this version number are listed (keyset pagination)
+        :param limit: the maximum number of listed versions (0 for no limit)
+        :return: the versions metadata, i.e. n_ver, tag, comment and last_modify (formatted as dd/mm/YYYY, HH:MM:SS)
+        :rtype: list
+        """
+        query = {'id': id}
+        if after_n_ver is not None:
+            query['n_ver'] = {'$lt': after_n_ver}
+        pipeline = [{'$match': query}, {'$sort': {'n_ver': pymongo.DESCENDING}}]
+        if limit > 0:
+            pipeline.append({'$limit': limit})
+        pipeline.append({'$project': {
+            '_id': 0, 'n_ver': 1, 'tag': 1, 'comment': 1,
+            'last_modify': {'$dateToString': {'format': '%d/%m/%Y, %H:%M:%S', 'date': '$last_modify'}}}})
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_VERSION_CONTROL).aggregate(
+            pipeline)
 
         list_obj = list()
         for x in cursor:
             list_obj.append(dict(x))
         return list_obj
+
+    def history_summary(self, ids):
+        """
+        Summarize the versions of several documents in a single query, without reading their content.
+        :param ids: the document IDs
+        :return: for each document with at least one version, its last version, i.e. n_ver, comment and last_modify,
+            and the last non-empty 'tag', if any
+        :rtype: dict
+        """
+        pipeline = [
+            {'$match': {'id': {'$in': list(ids)}}},
+            {'$sort': {'id': pymongo.ASCENDING, 'n_ver': pymongo.DESCENDING}},
+            {'$project': {'_id': 0, 'id': 1, 'n_ver': 1, 'tag': 1, 'comment': 1, 'last_modify': 1}},
+            {'$group': {'_id': '$id', 'n_ver': {'$first': '$n_ver'}, 'comment': {'$first': '$comment'},
+                        'last_modify': {'$first': '$last_modify'}, 'tags': {'$push': '$tag'}}}
+        ]
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_VERSION_CONTROL).aggregate(
+            pipeline)
+
+        summary = {}
+        for x in cursor:
+            summary[x['_id']] = {
+                'n_ver': x['n_ver'],
+                'comment': x['comment'],
+                'last_modify': x['last_modify'],
+                'tag': next((tag for tag in x['tags'] if tag), None)
+            }
+        return summary
+
+    def version_content(self, record):
+        """
+        :param record: a document, or a full versioned record
+        :return: the versioned content of the record, i.e. the fields which are not versioning metadata
+        :rtype: dict
+        """
+        return {key: value for key, value in record.items() if key not in self.VERSION_METADATA}
+
+    def restore_content(self, content):
+        """
+        :param content: the versioned content, as returned by version_content
+        :return: the fields of the rebuilt versioned record
+        :rtype: dict
+        """
+        return content
+
+    def rebuild_versions(self, records):
+        """
+        Replace the delta-encoded versioned records with the full records, rebuilt by applying the deltas to the
+        nearest previous checkpoint.
+        :param records: the versioned records, as retrieved from the version control collection
+        :return: the full versioned records
+        :rtype: list
+        """
+        targets = {}
+        for record in records:
+            if 'delta' in record:
+                targets.setdefault(record['id'], []).append(record['n_ver'])
+        if len(targets) == 0:
+            return records
+
+        contents = {}
+        collection = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_VERSION_CONTROL)
+        for id, n_vers in targets.items():
+            checkpoint = collection.find_one({'id': id, 'n_ver': {'$lte': min(n_vers)}, 'delta': {'$exists': False}},
+                                             sort=[('n_ver', pymongo.DESCENDING)])
+            if checkpoint is None:
+                continue
+            content = self.version_content(checkpoint)
+            cursor = collection.find({'id': id, 'n_ver': {'$gt': checkpoint['n_ver'], '$lte': max(n_vers)}},
+                                     sort=[('n_ver', pymongo.ASCENDING)])
+            for x in cursor:
+                if 'delta' in x:
+                    content = diff_utils.patch(content, x['delta'])
+                else:
+                    content = self.version_content(x)
+                if x['n_ver'] in n_vers:
+                    contents[(id, x['n_ver'])] = content
+
+        list_obj = list()
+        for record in records:
+            if 'delta' in record and (record['id'], record['n_ver']) in contents:
+                content = copy.deepcopy(contents[(record['id'], record['n_ver'])])
+                record = {key: value for key, value in record.items() if key != 'delta'}
+                record.update(self.restore_content(content))
+            list_obj.append(record)
+        return list_obj
@@ -27,8 +27,562 @@ __license__ = "GPLv3"
 __status__ = "Production"
 __version__ = "1.0.0"
 
+import json
+import os
+import random
+import threading
+import time
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from apps.connector.InvalidationBus import InvalidationBus
+from apps.connector.MongoConnector import MongoConnector
 from apps.models.nosql.BaseDocument import BaseDocument
+from apps.utils import cache_utils
+from apps.utils.db_utils import AlchemyEncoder
 
 
-class Graph(BaseDocument):
+class RevisionConflict(Exception):
+    """
+    Raised when a configuration graph has been modified by a concurrent writer since it was read.
+    """
     pass
+
+
+class Graph(BaseDocument):
+    """
+    A configuration graph. Depending on the GRAPH_STORAGE_MODE environment variable, the graph is stored either as a
+    JSON string ('string', legacy format) or as a native subdocument ('native'), whose arrays (services, interfaces,
+    nodes, connections and processors_releases) are edited in place with targeted update operators.
+    Independently of the storage mode, the REST API always exposes the graph as a JSON string.
+    Every modification increments the 'revision' of the document: modifications depending on a previous read of the
+    graph are applied only if the revision has not changed in the meantime, and are otherwise retried.
+    The graphs read by find_graph and load_graph are kept in a per-process LRU cache, bounded by GRAPH_CACHE_ENTRIES
+    entries and GRAPH_CACHE_SIZE_MB megabytes, and dropped upon any write through this class, in this process and, via
+    the invalidation bus, in the other ones; as a safety net, entries also expire after GRAPH_CACHE_TTL seconds.
+    Every modification is recorded in a change log, with the new revision and the modified elements; the change log
+    entries expire after GRAPH_CHANGE_LOG_TTL seconds.
+    """
+
+    PUBLISH_WRITES = True
+
+    CACHE = cache_utils.LRUCache(int(os.getenv('GRAPH_CACHE_ENTRIES', 32)),
+                                 int(os.getenv('GRAPH_CACHE_SIZE_MB', 256)) * 1024 * 1024,
+                                 float(os.getenv('GRAPH_CACHE_TTL', 300)))
+
+    GRAPH_ELEMENTS = ('services', 'interfaces', 'nodes', 'connections', 'processors_releases')
+
+    INDEXES = [
+        ([('id', ASCENDING)], {}),
+        ([('id', ASCENDING), ('last_modify', DESCENDING)], {})
+    ]
+    VERSION_CONTROL_INDEXES = [
+        ([('id', ASCENDING), ('n_ver', DESCENDING)], {'unique': True}),
+        ([('id', ASCENDING), ('tag', ASCENDING)], {}),
+        ([('id', ASCENDING), ('last_modify', DESCENDING)], {})
+    ]
+
+    CHANGE_LOG_INDEXES = [
+        ([('id', ASCENDING), ('revision', ASCENDING)], {'unique': True}),
+        ([('last_modify', ASCENDING)], {'expireAfterSeconds': int(os.getenv('GRAPH_CHANGE_LOG_TTL', 7 * 24 * 3600))})
+    ]
+
+    # Notified whenever a change is logged by this process
+    CHANGES = threading.Condition()
+
+    QUERIES = [
+        ({'id': ''}, None),
+        ({'id': ''}, [('last_modify', DESCENDING)])
+    ]
+    VERSION_CONTROL_QUERIES = [
+        ({'id': ''}, [('n_ver', DESCENDING)]),
+        ({'id': '', 'n_ver': 1}, None),
+        ({'$and': [{'id': ''}, {'tag': ''}]}, None),
+        ({'id': ''}, [('last_modify', DESCENDING)])
+    ]
+    CHANGE_LOG_QUERIES = [
+        ({'id': '', 'revision': {'$gt': 0}}, [('revision', ASCENDING)])
+    ]
+
+    def __init__(self):
+        super().__init__()
+        self.COLLECTION_NAME_CHANGE_LOG = self.COLLECTION_NAME + '_changes'
+        self.STORAGE_MODE = os.getenv('GRAPH_STORAGE_MODE', 'string')
+        self.UPDATE_RETRIES = int(os.getenv('GRAPH_UPDATE_RETRIES', 10))
+        return
+
+    def is_native(self):
+        return self.STORAGE_MODE == 'native'
+
+    def index_declarations(self):
+        return super().index_declarations() + [
+            (self.COLLECTION_NAME_CHANGE_LOG, self.CHANGE_LOG_INDEXES, self.CHANGE_LOG_QUERIES)]
+
+    @staticmethod
+    def parse(document):
+        """
+        :param document: a configuration document, in any storage format
+        :return: the graph of the document as a dictionary
+        :rtype: dict
+        """
+        graph = document.get('graph')
+        if graph is None:
+            return {}
+        if isinstance(graph, str):
+            return json.loads(graph)
+        return graph
+
+    @staticmethod
+    def to_api(document):
+        """
+        :param document: a configuration document, in any storage format
+        :return: the document in the shape exposed by the REST API, i.e. with the graph serialized as JSON string
+        :rtype: dict
+        """
+        if document is not None and 'graph' in document and not isinstance(document['graph'], str):
+            document['graph'] = json.dumps(document['graph'])
+        return document
+
+    def new_graph(self, graph=None):
+        """
+        :param graph: the graph dictionary
+        :return: the graph in the format of the configured storage mode
+        """
+        if graph is None:
+            graph = {}
+        return graph if self.is_native() else json.dumps(graph)
+
+    def find_graph(self, config_id):
+        """
+        :param config_id: the configuration ID
+        :return: the configuration document in the REST API shape, or None if not found
+        :rtype: dict
+        """
+        entry = self.__cached(config_id)
+        return dict(entry['document']) if entry is not None else None
+
+    def load_graph(self, config_id):
+        """
+        :param config_id: the configuration ID
+        :return: the graph of the configuration as a dictionary, or None if not found; the dictionary may be shared
+            with other readers, and must not be modified
+        :rtype: dict
+        """
+        entry = self.__cached(config_id)
+        return entry['graph'] if entry is not None else None
+
+    def serialize_graph(self, config_id, raw=False):
+        """
+        Serialize the configuration document as the body of a REST API response; the serialization is cached with
+        the document, so that it is computed once per revision.
+        :param config_id: the configuration ID
+        :param raw: if True, the graph is embedded in the document as a JSON object, rather than as a JSON string
+        :return: the configuration document in the REST API shape and its serialization, or (None, None) if not found
+        :rtype: tuple
+        """
+        entry = self.__cached(config_id)
+        if entry is None:
+            return None, None
+        key = 'raw' if raw else 'json'
+        content = entry.get(key)
+        if content is None:
+            document = entry['document']
+            if raw:
+                # The graph is already serialized: splice it in the serialized document, instead of escaping it
+                metadata = json.dumps({k: v for k, v in document.items() if k != 'graph'}, cls=AlchemyEncoder)
+                content = (metadata[:-1] + (', ' if len(metadata) > 2 else '') + '"graph": ' + document['graph'] +
+                           '}').encode('utf-8')
+            else:
+                content = json.dumps(document, cls=AlchemyEncoder).encode('utf-8')
+            entry[key] = content
+        return entry['document'], content
+
+    def __cached(self, config_id):
+        InvalidationBus().start()
+        entry = self.CACHE.get(config_id)
+        if entry is not None:
+            return entry
+        generation = self.CACHE.generation(config_id)
+        document = self.find_one({'id': config_id})
+        if document is None:
+            return None
+        graph = self.parse(document)
+        document = self.to_api(document)
+        entry = {'document': document, 'graph': graph}
+
+        # Besides the serialized graph, the entry may hold the parsed graph and up to two serialized responses
+        self.CACHE.put(config_id, entry, 4 * len(document['graph']), generation)
+        return entry
+
+    def invalidate(self, query):
+        self.drop_cached(query.get('id') if query is not None else None)
+
+    @staticmethod
+    def drop_cached(config_id):
+        """
+        :param config_id: the configuration ID whose cached graph is dropped, or None to drop all the cached graphs
+        """
+        if isinstance(config_id, str):
+            Graph.CACHE.invalidate(config_id)
+        else:
+            Graph.CACHE.clear()
+
+    def find_elements(self, config_id, key, fields):
+        """
+        Retrieve only the given fields of the elements of one graph array, e.g. the names of the nodes.
+        :param config_id: the configuration ID
+        :param key: the graph array (one of GRAPH_ELEMENTS)
+        :param fields: the element fields to be retrieved
+        :return: the list of (partial) elements and the revision of the graph, or (None, None) if the configuration
+            is not found
+        :rtype: tuple
+        """
+        document = None
+        if self.is_native():
+            projection = {'graph.' + key + '.' + field: 1 for field in fields}
+            projection['revision'] = 1
+            document = self.find_one({'id': config_id, 'graph': {'$type': 'object'}}, projection)
+        if document is None:
+            document = self.find_one({'id': config_id})
+        if document is None:
+            return None, None
+        return self.parse(document).get(key, []), document.get('revision', 0)
+
+    def replace_graph(self, config_id, graph):
+        """
+        Replace the whole graph of the configuration.
+        :param config_id: the configuration ID
+        :param graph: the graph dictionary
+        :return: the updated document in the REST API shape, or None if not found
+        :rtype: dict
+        """
+        document = self.find_one_and_update({'id': config_id}, {'$set': {'graph': self.new_graph(graph)},
+                                                                '$inc': {'revision': 1}})
+        self.__log_changes(document, [{'op': 'replace'}])
+        return self.to_api(document)
+
+    def update_graph(self, config_id, update, apply, array_filters=None, revision=None, changes=None):
+        """
+        Modify the graph of the configuration. In native storage mode, the update operators are sent to the database,
+        so that only the affected elements are touched; otherwise (or if the document has not been migrated yet), the
+        graph is loaded, modified in memory by the apply function and stored back, provided that no concurrent
+        modification occurred in the meantime; if one did, the modification is retried on the updated graph.
+        :param config_id: the configuration ID
+        :param update: the update operators on the 'graph' subdocument, used in native storage mode
+        :param apply: the function modifying the graph dictionary in place, used in string storage mode
+        :param array_filters: the filters of the $[<identifier>] positional operators used in the update, if any
+        :param revision: if set, the revision of the graph on which the modification is based; if the graph has been
+            modified since, RevisionConflict is raised, so that the caller can re-read the graph and retry
+        :param changes: the description of the modification, recorded in the change log, as a list of
+            {'op': 'add' | 'update' | 'delete', 'element': <graph array>, 'id': <element ID>} dictionaries, where a
+            missing ID means that the whole array is affected; if not given, the whole graph is considered replaced
+        :return: the updated document in the REST API shape, or None if not found
+        :rtype: dict
+        """
+        if changes is None:
+            changes = [{'op': 'replace'}]
+        if self.is_native():
+            query = {'id': config_id, 'graph': {'$type': 'object'}}
+            if revision is not None:
+                query['revision'] = self.__revision_query(revision)
+            update = dict(update)
+            update['$inc'] = dict(update.get('$inc', {}))
+            update['$inc']['revision'] = 1
+            document = self.find_one_and_update(query, update, array_filters=array_filters)
+            if document is not None:
+                self.__log_changes(document, changes)
+                return self.to_api(document)
+
+        if revision is not None:
+            return self.__apply(config_id, apply, revision, changes)
+        return self.retry(lambda: self.__apply(config_id, apply, changes=changes))
+
+    def retry(self, modification):
+        """
+        Run a graph modification, running it again, after a short random delay, as long as it raises
+        RevisionConflict, up to UPDATE_RETRIES times. If the last attempt conflicts too, RevisionConflict is raised:
+        the REST API reports it with status 409.
+        :param modification: the function reading and modifying the graph
+        :return: the value returned by the modification
+        """
+        for attempt in range(self.UPDATE_RETRIES):
+            try:
+                return modification()
+            except RevisionConflict:
+                time.sleep(random.uniform(0, 0.01 * (attempt + 1)))
+        return modification()
+
+    def __apply(self, config_id, apply, revision=None, changes=None):
+        document = self.find_one({'id': config_id})
+        if document is None:
+            return None
+        current = document.get('revision', 0)
+        if revision is not None and current != revision:
+            raise RevisionConflict(config_id)
+
+        # The apply function returns False if it does not modify the graph: nothing is written then
+        json_data = self.parse(document)
+        if apply(json_data) is False:
+            return self.to_api(document)
+        graph = self.new_graph(json_data)
+        document = self.find_one_and_update({'id': config_id, 'revision': self.__revision_query(current)},
+                                            {'$set': {'graph': graph}, '$inc': {'revision': 1}},
+                                            projection={'graph': 0})
+        if document is None:
+            raise RevisionConflict(config_id)
+        self.__log_changes(document, changes)
+        document['graph'] = graph
+        return self.to_api(document)
+
+    def __revision_query(self, revision):
+        # Documents created before the introduction of the revision have none, which is equivalent to 0
+        return revision if revision else {'$in': [0, None]}
+
+    def __log_changes(self, document, changes):
+        if document is None or changes is None:
+            return
+        try:
+            MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_CHANGE_LOG).insert_one({
+                'id': document['id'],
+                'revision': document.get('revision', 0),
+                'changes': changes,
+                'last_modify': document.get('last_modify')
+            })
+        except DuplicateKeyError:
+            pass
+        with Graph.CHANGES:
+            Graph.CHANGES.notify_all()
+
+    def find_changes(self, config_id, after_revision, limit=0):
+        """
+        :param config_id: the configuration ID
+        :param after_revision: the revision after which the changes are retrieved
+        :param limit: the maximum number of retrieved changes, or 0 for no limit
+        :return: the change log entries, sorted by revision, i.e. dictionaries with the 'revision', the 'changes'
+            and the 'last_modify' date
+        :rtype: list
+        """
+        cursor = MongoConnector().get_collection(self.MONGO_DB_NAME, self.COLLECTION_NAME_CHANGE_LOG).find(
+            {'id': config_id, 'revision': {'$gt': after_revision}}, {'_id': 0, 'id': 0},
+            sort=[('revision', ASCENDING)], limit=limit)
+        return list(cursor)
+
+    def changes_since(self, config_id, since):
+        """
+        Compute the modifications of the graph elements after the given revision, from the change log. If the change
+        log does not cover all the revisions since then (e.g. expired entries) or the graph has been replaced, the
+        whole graph is returned instead.
+        :param config_id: the configuration ID
+        :param since: the revision held by the client
+        :return: a dictionary with the current 'revision' and 'snapshot': False, and, for each modified graph array,
+            either the 'added' and 'updated' elements and the 'removed' element IDs, or the whole array as 'replaced'
+            if not known element by element; or, if the changes are not available, 'snapshot': True and the whole
+            'graph'; None if the configuration is not found
+        :rtype: dict
+        """
+        entry = self.__cached(config_id)
+        if entry is None:
+            return None
+        revision = entry['document'].get('revision', 0)
+        graph = entry['graph']
+        snapshot = {'revision': revision, 'snapshot': True, 'graph': graph}
+        if since > revision:
+            return snapshot
+
+        log = [change for change in self.find_changes(config_id, since) if change['revision'] <= revision]
+        if [change['revision'] for change in log] != list(range(since + 1, revision + 1)):
+            return snapshot
+
+        # Collect the elements touched since the given revision, and whether they have been created in the meantime
+        touched = {}
+        for change in log:
+            for item in change['changes']:
+                if item.get('op') not in ('add', 'update', 'delete') or item.get('element') not in self.GRAPH_ELEMENTS:
+                    return snapshot
+                ids = touched.setdefault(item['element'], {})
+                if ids is None:
+                    continue
+                if item.get('id') is None:
+                    touched[item['element']] = None
+                    continue
+                ids.setdefault(item['id'], item['op'] == 'add')
+
+        changes = {}
+        for key, ids in touched.items():
+            elements = graph.get(key, [])
+            if ids is None:
+                changes[key] = {'replaced': elements}
+                continue
+            current = {}
+            for element in elements:
+                if element.get('id') in ids:
+                    current.setdefault(element['id'], []).append(element)
+            added, updated, removed = [], [], []
+            for element_id, created in ids.items():
+                if element_id in current:
+                    (added if created else updated).extend(current[element_id])
+                elif not created:
+                    removed.append(element_id)
+            changes[key] = {'added': added, 'updated': updated, 'removed': removed}
+        return {'revision': revision, 'snapshot': False, 'changes': changes}
+
+    @staticmethod
+    def wait_changes(timeout):
+        """
+        Wait until a change is logged by this process, or the timeout expires.
+        :param timeout: the timeout in seconds
+        """
+        with Graph.CHANGES:
+            Graph.CHANGES.wait(timeout)
+
+    def add_element(self, config_id, key, element):
+        """
+        Append an element (e.g. a service) to one graph array.
+        """
+        def apply(json_data):
+            json_data.setdefault(key, []).append(element)
+
+        return self.update_graph(config_id, {'$push': {'graph.' + key: element}}, apply,
+                                 changes=[{'op': 'add', 'element': key, 'id': element.get('id')}])
+
+    def update_element(self, config_id, key, element_id, fields):
+        """
+        Set the given fields of the element(s) of one graph array with the given ID.
+        """
+        def apply(json_data):
+            for element in json_data.get(key, []):
+                if element.get('id') == element_id:
+                    element.update(fields)
+
+        update = {'$set': {'graph.' + key + '.$[elem].' + field: value for field, value in fields.items()}}
+        return self.update_graph(config_id, update, apply, [{'elem.id': element_id}],
+                                 changes=[{'op': 'update', 'element': key, 'id': element_id}])
+
+    def remove_element(self, config_id, key, element_id):
+        """
+        Remove the element(s) of one graph array with the given ID.
+        """
+        def apply(json_data):
+            json_data[key] = [element for element in json_data.get(key, []) if element.get('id') != element_id]
+
+        return self.update_graph(config_id, {'$pull': {'graph.' + key: {'id': element_id}}}, apply,
+                                 changes=[{'op': 'delete', 'element': key, 'id': element_id}])
+
+    def apply_batch(self, config_id, operations):
+        """
+        Apply an ordered list of element operations to the graph, in a single pass and a single write. Each operation
+        is a dictionary with the following keys:
+        - 'op': one of 'add', 'update' and 'delete'
+        - 'element': the graph array (one of GRAPH_ELEMENTS)
+        - 'id': the ID of the element ('add' operations require the element to carry its ID)
+        - 'fields': the element to be added, or the fields to be updated
+        Invalid operations, and operations on missing elements, are skipped, without affecting the others; if all the
+        operations are skipped, the graph is not written, and its revision is unchanged.
+        :param config_id: the configuration ID
+        :param operations: the list of operations
+        :return: the updated document in the REST API shape and the per-operation results, i.e. dictionaries with the
+            'id' of the element and a 'status' code (200, 400 if the operation is invalid, 404 if the element is not
+            found), or (None, None) if the configuration is not found
+        :rtype: tuple
+        """
+        results = []
+        changes = []
+
+        def apply(json_data):
+            # The batch may be applied more than once, upon concurrent modifications
+            del results[:]
+            del changes[:]
+            for operation in operations:
+                result = self.__apply_operation(json_data, operation)
+                results.append(result)
+                if result['status'] == 200:
+                    changes.append({'op': operation['op'], 'element': operation['element'], 'id': result['id']})
+            return len(changes) > 0
+
+        document = self.retry(lambda: self.__apply(config_id, apply, changes=changes))
+        if document is None:
+            return None, None
+        return document, results
+
+    def __apply_operation(self, json_data, operation):
+        if not isinstance(operation, dict):
+            return {'id': None, 'status': 400}
+        op = operation.get('op')
+        key = operation.get('element')
+        fields = operation.get('fields') or {}
+        element_id = operation.get('id', fields.get('id'))
+        result = {'id': element_id, 'status': 400}
+        if key not in self.GRAPH_ELEMENTS or element_id is None or not isinstance(fields, dict):
+            return result
+
+        elements = json_data.setdefault(key, [])
+        matches = [element for element in elements if element.get('id') == element_id]
+        if op == 'add':
+            if matches:
+                return result
+            element = dict(fields)
+            element['id'] = element_id
+            elements.append(element)
+        elif op == 'update':
+            if not matches:
+                result['status'] = 404
+                return result
+            for element in matches:
+                element.update({field: value for field, value in fields.items() if field != 'id'})
+        elif op == 'delete':
+            if not matches:
+                result['status'] = 404
+                return result
+            json_data[key] = [element for element in elements if element.get('id') != element_id]
+        else:
+            return result
+        result['status'] = 200
+        return result
+
+    def version_content(self, record):
+        """
+        The graph is versioned in its parsed form, so that the version deltas are computed element by element.
+        """
+        content = super().version_content(record)
+        if 'graph' in content:
+            content['graph'] = self.parse(content)
+        return content
+
+    def restore_content(self, content):
+        if 'graph' in content:
+            content['graph'] = self.new_graph(content['graph'])
+        return content
+
+    def migrate_storage(self, batch_size=500):
+        """
+        One-shot migration of the stored graphs, in both the current and the versioned documents, from JSON strings
+        to native subdocuments. The last modification dates are preserved; the revision of the current documents is
+        incremented, so that the clients reload them, and their cached copies are dropped in all the processes, via
+        the invalidation bus.
+        :return: the number of migrated documents
+        :rtype: int
+        """
+        migrated = 0
+        for collection_name in (self.COLLECTION_NAME, self.COLLECTION_NAME_VERSION_CONTROL):
+            collection = MongoConnector().get_collection(self.MONGO_DB_NAME, collection_name)
+            update = {'$inc': {'revision': 1}} if collection_name == self.COLLECTION_NAME else {}
+            requests = []
+            config_ids = []
+            for document in collection.find({'graph': {'$type': 'string'}}, {'graph': 1, 'id': 1}):
+                requests.append(UpdateOne({'_id': document['_id'], 'graph': document['graph']},
+                                          dict(update, **{'$set': {'graph': json.loads(document['graph'])}})))
+                config_ids.append(document.get('id'))
+                if len(requests) >= batch_size:
+                    migrated += collection.bulk_write(requests, ordered=False).modified_count
+                    requests = []
+            if requests:
+                migrated += collection.bulk_write(requests, ordered=False).modified_count
+            if collection_name == self.COLLECTION_NAME:
+                for config_id in config_ids:
+                    InvalidationBus().publish('Graph', config_id)
+        self.invalidate(None)
+        return migrated
+
+
+InvalidationBus().subscribe('Graph', Graph.drop_cached)
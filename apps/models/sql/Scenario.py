@@ -27,11 +27,20 @@ __license__ = "GPLv3"
 __status__ = "Production"
 __version__ = "1.0.0"
 
+import os
 from datetime import datetime
 
 from apps import db
+from apps.connector.InvalidationBus import InvalidationBus
+from apps.utils import cache_utils
 from apps.utils.db_utils import generate_uuid
 
+# The scenarios catalogue, loaded at once and kept in each process until a scenario is written (in any process, via
+# the invalidation bus) or until it expires after SCENARIO_CACHE_TTL seconds
+CATALOGUE = cache_utils.LRUCache(1, 1, float(os.getenv('SCENARIO_CACHE_TTL', 300)))
+COLUMNS = ('id', 'idUser', 'name', 'description', 'startDate', 'endDate', 'increaseTime', 'createDate', 'locked',
+           'modifyDate')
+
 
 class Scenario(db.Model):
     __tablename__ = 'scenario'
@@ -55,6 +64,62 @@ class Scenario(db.Model):
             setattr(self, property, value)
 
 
+def get_catalogue():
+    """
+    Retrieve the scenarios catalogue, loading it from the database if missing. The catalogue indexes the column
+    values of the scenarios by ID, and the IDs of the scenarios by user, most recently modified first.
+    :return: the scenarios catalogue
+    :rtype: dict
+    """
+    InvalidationBus().start()
+    catalogue = CATALOGUE.get('scenarios')
+    if catalogue is not None:
+        return catalogue
+    generation = CATALOGUE.generation('scenarios')
+    rows = [{column: getattr(scenario, column) for column in COLUMNS} for scenario in Scenario.query.all()]
+    by_user = {}
+    for row in sorted(rows, key=lambda row: row['modifyDate'] or datetime.min, reverse=True):
+        by_user.setdefault(row['idUser'], []).append(row['id'])
+    catalogue = {
+        'ids': [row['id'] for row in rows],
+        'by_id': {row['id']: row for row in rows},
+        'by_user': by_user
+    }
+    CATALOGUE.put('scenarios', catalogue, 1, generation)
+    return catalogue
+
+
+def invalidate_catalogue(key=None):
+    """
+    Drop the scenarios catalogue of this process.
+    :param key: the ID of the written scenario (unused, the whole catalogue is dropped)
+    """
+    CATALOGUE.invalidate('scenarios')
+
+
+def scenario_written(scenario_id):
+    """
+    Drop the scenarios catalogue, in this process and in the other ones.
+    :param scenario_id: the ID of the written scenario
+    """
+    invalidate_catalogue()
+    InvalidationBus().publish('Scenario', scenario_id)
+
+
+def get_cache_stats():
+    """
+    :return: the hit and miss counters of the scenarios catalogue
+    :rtype: dict
+    """
+    return CATALOGUE.get_stats()
+
+
+def _copy(catalogue, scenario_id):
+    # The scenarios are returned as new, transient objects, which the callers can freely modify
+    row = catalogue['by_id'].get(scenario_id)
+    return Scenario(**row) if row is not None else None
+
+
 def get_scenarios():
     """
     :param id:
@@ -62,7 +127,8 @@ def get_scenarios():
     :return:
     :rtype:
     """
-    return Scenario.query.all()
+    catalogue = get_catalogue()
+    return [_copy(catalogue, scenario_id) for scenario_id in catalogue['ids']]
 
 
 def get_scenario(scenario_id):
@@ -72,7 +138,7 @@ def get_scenario(scenario_id):
     :return:
     :rtype:
     """
-    return Scenario.query.filter_by(id=scenario_id).first()
+    return _copy(get_catalogue(), scenario_id)
 
 
 def get_scenarios_by_user_id(user_id):
@@ -82,8 +148,8 @@ def get_scenarios_by_user_id(user_id):
     :return:
     :rtype:
     """
-    q = Scenario.query.filter_by(idUser=user_id).order_by(Scenario.modifyDate.desc()).all()
-    return q
+    catalogue = get_catalogue()
+    return [_copy(catalogue, scenario_id) for scenario_id in catalogue['by_user'].get(user_id, [])]
 
 
 def get_scenario_by_user_id_and_scenario_id(user_id, scenario_id):
@@ -95,7 +161,8 @@ def get_scenario_by_user_id_and_scenario_id(user_id, scenario_id):
     :return:
     :rtype:
     """
-    return Scenario.query.filter_by(idUser=user_id, id=scenario_id).first()
+    scenario = get_scenario(scenario_id)
+    return scenario if scenario is not None and scenario.idUser == user_id else None
 
 
 def save_scenario(user_id, name, description, start_date, end_date, time_step=365, locked=False):
@@ -126,6 +193,7 @@ def save_scenario(user_id, name, description, start_date, end_date, time_step=36
                             modifyDate=modifyDate)
         db.session.add(scenario)
         db.session.commit()
+        scenario_written(uuid)
     except Exception as ex:
         uuid = None
     return uuid
@@ -160,6 +228,7 @@ def save_scenario_with_id(uuid, user_id, name, description, start_date, end_date
                             modifyDate=modifyDate)
         db.session.add(scenario)
         db.session.commit()
+        scenario_written(uuid)
     except Exception as ex:
         uuid = None
     return uuid
@@ -190,6 +259,7 @@ def update_scenario(uuid, name, description, start_date, end_date, time_step=365
                                                       endDate=end_date, increaseTime=time_step, locked=locked,
                                                       modifyDate=modifyDate))
         db.session.commit()
+        scenario_written(uuid)
     except Exception as ex:
         uuid = None
     return uuid
@@ -210,6 +280,10 @@ def delete_scenario(scenario_id):
         ).delete()
 
         db.session.commit()
+        scenario_written(scenario_id)
     except Exception as ex:
         pass
     return
+
+
+InvalidationBus().subscribe('Scenario', invalidate_catalogue)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+import json
+import os
+import time
+
+import pymongo
+from flask import Response
+from sqlalchemy import text
+
+from apps import db
+from apps.connector.MongoConnector import MongoConnector
+from apps.routes.health import blueprint
+
+
+@blueprint.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    Liveness probe: the worker is up and serving requests. The databases are not checked.
+    :return: the status of the worker
+    :rtype: Response
+    """
+    return Response(json.dumps({'status': 'ok', 'pid': os.getpid()}), mimetype="application/json", status=200)
+
+
+@blueprint.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness probe: the worker can reach the Mongo and Postgres databases. The status of each database is reported
+    with the latency of a round trip; if any of them is not reachable, the response status is 503.
+    :return: the status of the worker and of the databases
+    :rtype: Response
+    """
+    checks = {
+        'mongo': check_dependency(ping_mongo),
+        'postgres': check_dependency(ping_postgres)
+    }
+    checks['mongo']['pool'] = MongoConnector().get_pool_stats()
+    ready = all(check['status'] == 'ok' for check in checks.values())
+    return Response(json.dumps({'status': 'ok' if ready else 'unavailable', 'checks': checks}),
+                    mimetype="application/json", status=200 if ready else 503)
+
+
+def check_dependency(ping):
+    """
+    Run the given ping function and measure its latency.
+    :param ping: the function checking the reachability of a database
+    :return: the status of the database, the latency in milliseconds and the error, if any
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    try:
+        ping()
+        return {'status': 'ok', 'latency_ms': round((time.perf_counter() - start) * 1000, 3)}
+    except Exception as ex:
+        return {'status': 'error', 'latency_ms': round((time.perf_counter() - start) * 1000, 3), 'error': str(ex)}
+
+
+def ping_mongo():
+    with pymongo.timeout(float(os.getenv('READINESS_TIMEOUT', 2))):
+        MongoConnector().get_connection().admin.command('ping')
+
+
+def ping_postgres():
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(text("SET LOCAL statement_timeout = {}".format(
+                int(float(os.getenv('READINESS_TIMEOUT', 2)) * 1000))))
+        db.session.execute(text('SELECT 1'))
+    finally:
+        db.session.remove()
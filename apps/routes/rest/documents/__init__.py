@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+from flask import Blueprint
+
+blueprint = Blueprint(
+    'rest_api_documents_blueprint',
+    __name__,
+)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+import json
+import os
+import time
+from datetime import datetime
+
+from flask import Response, send_file
+from flask import request
+from flask_login import login_required
+
+import apps.routes.rest.interfaces.routes as interfaces_routes
+import apps.routes.rest.services.routes as services_routes
+import apps.utils.cache_utils as cache_utils
+import apps.utils.file_utils as file_utils
+import apps.utils.job_utils as job_utils
+from apps.models.nosql.Graph import Graph
+from apps.models.sql import Scenario
+from apps.routes.rest.documents import blueprint
+
+# The documents which can be generated, with the functions computing their key in the document cache and
+# generating them
+DOCUMENTS = {
+    'services': (services_routes.services_document_key, services_routes.generate_services_document),
+    'interfaces': (interfaces_routes.interfaces_document_key, interfaces_routes.generate_interfaces_document)
+}
+
+
+@blueprint.route('/rest/api/documents/jobs', methods=['POST'])
+@login_required
+def submit_document_job():
+    """
+    Request the generation of a document in the background, e.g.: {"type": "services", "config_id": "..."}
+    The job ID identifies the configuration revision and the inputs of the document: the requests of the same
+    document share the same job, which is run again only if the previous run failed or was interrupted.
+    :return: the job, with status 200 if the document is ready, or 202 if it is being generated
+    :rtype: Response
+    """
+    try:
+        body = None
+        if request.data != b'':
+            body = json.loads(request.data.decode('utf-8'))
+        if body is None or body.get('type') not in DOCUMENTS or not body.get('config_id'):
+            return Response(json.dumps({'error': '400'}), mimetype="application/json", status=400)
+
+        return document_job_response(body['type'], body['config_id'])
+
+    except Exception as ex:
+        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+
+
+def document_job_response(document_type, config_id, download=False):
+    """
+    Request the generation of a document in the background: share the pending job, or the document already
+    generated, or start a new job.
+    :param document_type: the document type, see DOCUMENTS
+    :param config_id: the configuration ID
+    :param download: whether the document, if already generated, is sent instead of the job
+    :return: the job, with status 200 if the document is ready, or 202 (with its Location) if it is being generated
+    :rtype: Response
+    """
+    try:
+        graph = Graph()
+        scen_graph = graph.find_graph(config_id)
+        scenario = Scenario.get_scenario(config_id)
+        if scen_graph is None or scenario is None:
+            return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
+
+        key = DOCUMENTS[document_type][0](config_id, scen_graph)
+        store = job_utils.get_job_store()
+        job = store.get(key)
+
+        # Share the pending job, or the document already generated
+        if job is None or not store.is_pending(job):
+            if cache_utils.get_document_cache().get(key) is not None:
+                if job is None or job['status'] != job_utils.DONE:
+                    job = store.save(dict(new_job(document_type, config_id, scen_graph, key),
+                                          status=job_utils.DONE, pid=os.getpid(), error=None))
+            else:
+
+                # Start a new job
+                store.purge()
+                job = start_job(document_type, config_id, scen_graph, key)
+
+        if job['status'] != job_utils.DONE:
+            return Response(json.dumps(job_view(job)), mimetype="application/json", status=202,
+                            headers={'Location': '/rest/api/documents/jobs/' + job['id']})
+        if download:
+            return download_document_job(job['id'])
+        return Response(json.dumps(job_view(job)), mimetype="application/json", status=200)
+
+    except job_utils.JobQueueFull:
+        return Response(json.dumps({'error': '503'}), mimetype="application/json", status=503,
+                        headers={'Retry-After': '30'})
+    except Exception as ex:
+        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+
+
+@blueprint.route('/rest/api/documents/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_document_job(job_id):
+    """
+    Retrieve the status of a document job: 'queued', 'running', 'done' or 'failed'. With the 'wait' parameter, the
+    response is delayed until the job is completed, for at most the given number of seconds (up to
+    DOCUMENT_JOBS_MAX_WAIT, kept short as the request holds a server thread meanwhile).
+    A queued job whose submitting process exited (e.g. a recycled worker) is submitted again, as long as the
+    configuration is not modified; any other interrupted job is reported as failed, and is run again upon the next
+    submission.
+    :param job_id: the job ID
+    :return: the job
+    :rtype: Response
+    """
+    try:
+        store = job_utils.get_job_store()
+        job = store.get(job_id)
+        if job is None:
+            return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
+
+        wait = min(request.args.get('wait', 0, type=float), float(os.getenv('DOCUMENT_JOBS_MAX_WAIT', 3)))
+        deadline = time.monotonic() + wait
+        while store.is_pending(job) and time.monotonic() < deadline:
+            time.sleep(0.5)
+            job = store.get(job_id) or job
+
+        # The process in charge of the job is gone
+        if job['status'] in (job_utils.QUEUED, job_utils.RUNNING) and not store.is_pending(job):
+            job = requeue_job(job)
+
+        return Response(json.dumps(job_view(job)), mimetype="application/json", status=200)
+
+    except Exception as ex:
+        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+
+
+@blueprint.route('/rest/api/documents/jobs/<job_id>/document', methods=['GET'])
+@login_required
+def download_document_job(job_id):
+    """
+    :param job_id: the job ID
+    :return: the generated document, or status 409 if the job is not completed
+    :rtype: Response
+    """
+    try:
+        job = job_utils.get_job_store().get(job_id)
+        if job is None:
+            return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
+        path = cache_utils.get_document_cache().get(job_id) if job['status'] == job_utils.DONE else None
+        if path is None:
+            return Response(json.dumps({'error': '409'}), mimetype="application/json", status=409)
+
+        scenario = Scenario.get_scenario(job['config_id'])
+        name = scenario.name if scenario is not None else job['type']
+        return send_file(path, as_attachment=True,
+                         download_name=name + ' - ' + file_utils.get_date_for_file() + '.docx')
+
+    except Exception as ex:
+        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+
+
+def generate_document(document_type, key, config_id, json_data):
+    """
+    Generate a document and store it in the document cache; run in the processes of the job runner.
+    :param document_type: the document type, see DOCUMENTS
+    :param key: the key of the document in the document cache
+    :param config_id: the configuration ID
+    :param json_data: the configuration graph
+    """
+    cache_utils.get_document_cache().put(key, DOCUMENTS[document_type][1](config_id, json_data))
+
+
+def new_job(document_type, config_id, scen_graph, key):
+    """
+    :param document_type: the document type, see DOCUMENTS
+    :param config_id: the configuration ID
+    :param scen_graph: the configuration document
+    :param key: the key of the document in the document cache, used as job ID
+    :return: a new job generating the document
+    :rtype: dict
+    """
+    return {
+        'id': key,
+        'type': document_type,
+        'config_id': config_id,
+        'revision': scen_graph.get('revision', 0),
+        'created': time.time()
+    }
+
+
+def start_job(document_type, config_id, scen_graph, key):
+    """
+    Submit the generation of a document, unless it is already pending.
+    :param document_type: the document type, see DOCUMENTS
+    :param config_id: the configuration ID
+    :param scen_graph: the configuration document
+    :param key: the key of the document in the document cache, used as job ID
+    :return: the job
+    :rtype: dict
+    """
+    return job_utils.get_job_runner().submit(new_job(document_type, config_id, scen_graph, key), generate_document,
+                                             document_type, key, config_id, Graph().load_graph(config_id))
+
+
+def requeue_job(job):
+    """
+    Submit again a job interrupted before being run, if the configuration is unchanged.
+    :param job: the interrupted job
+    :return: the job submitted again, or the interrupted job marked as failed
+    :rtype: dict
+    """
+    interrupted = dict(job, status=job_utils.FAILED, error='The job has been interrupted')
+    if job['status'] != job_utils.QUEUED or job.get('attempt', 1) >= int(os.getenv('DOCUMENT_JOBS_MAX_ATTEMPTS', 3)):
+        return interrupted
+    scen_graph = Graph().find_graph(job['config_id'])
+    if scen_graph is None or DOCUMENTS[job['type']][0](job['config_id'], scen_graph) != job['id']:
+        return interrupted
+    try:
+        return start_job(job['type'], job['config_id'], scen_graph, job['id'])
+    except job_utils.JobQueueFull:
+        return interrupted
+
+
+def job_view(job):
+    """
+    :param job: the job
+    :return: the job, as returned to the clients
+    :rtype: dict
+    """
+    return {
+        'id': job['id'],
+        'type': job['type'],
+        'config_id': job['config_id'],
+        'revision': job['revision'],
+        'status': job['status'],
+        'error': job.get('error'),
+        'created': datetime.fromtimestamp(job['created']).strftime("%d/%m/%Y, %H:%M:%S"),
+        'updated': datetime.fromtimestamp(job['updated']).strftime("%d/%m/%Y, %H:%M:%S"),
+        'document': '/rest/api/documents/jobs/' + job['id'] + '/document' if job['status'] == job_utils.DONE else None
+    }
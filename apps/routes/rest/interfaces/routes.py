@@ -27,6 +27,7 @@ __license__ = "GPLv3"
 __status__ = "Production"
 __version__ = "1.0.0"
 
+import itertools
 import json
 import os
 import urllib
@@ -34,30 +35,38 @@ import re
 
 import html2text
 import pymongo
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
-from docx.shared import Pt
-from flask import Response, send_file
+from flask import Response
 from flask import request
 from flask_login import login_required
 
 import apps.models.sql.Scenario as Scenario
 import apps.utils.auth_utils as auth_utils
+import apps.utils.cache_utils as cache_utils
 import apps.utils.db_utils as db_utils
+import apps.utils.http_utils as http_utils
 from apps.models.nosql.Graph import Graph
 from apps.routes.rest.interfaces import blueprint
 from apps.utils.file_utils import safe_open_w
 from apps.utils.word_document_generator import WordGenerator
 
+INTERFACES_TEMPLATE = ('apps/docs/interfaces/[ESA-EOPG-EOPGC-IF-6] ESA EO Operations Framework (EOF) - CSC - Ground '
+                       'Segment Master ICD - template.docx')
+
+# The version of the interfaces document generation, part of the document cache key: to be increased whenever a code
+# change alters the generated document, so that the documents generated by the previous code are not served anymore
+INTERFACES_DOCUMENT_VERSION = 1
+
 
 @blueprint.route('/rest/api/interfaces/<config_id>', methods=['GET'])
 @login_required
 def get_interfaces_configuration(config_id):
     try:
         graph = Graph()
-        scen_graph = graph.find({'id': config_id})
-        scen_graph = scen_graph[0]
-        return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        raw = request.args.get('format') == 'raw'
+        scen_graph, content = graph.serialize_graph(config_id, raw)
+        if scen_graph is None:
+            return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.document_response(scen_graph, content, 'raw' if raw else None)
     except Exception as ex:
         return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
@@ -80,34 +89,12 @@ def save_interfaces_configuration():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        obj = graph.find({'id': body['id']})
-        ''''''
-        obj = obj[0]
-        graph_obj = {}
-        '''
-        if not isinstance(obj, dict):
-            graph_obj = {'graph': json.loads(obj['graph'])}
-        elif not isinstance(obj['graph'], dict):
-            graph_obj = {'graph': json.loads(obj['graph'])}
+        if not isinstance(body['graph'], dict):
+            json_data = json.loads(body['graph'])
         else:
-            graph_obj = {'graph': obj['graph']}
-        '''
-        if not isinstance(body, dict):
-            graph_obj = {'id': body['id'], 'graph': json.loads(body['graph'])}
-        elif not isinstance(body['graph'], dict):
-            graph_obj = {'id': body['id'], 'graph': json.loads(body['graph'])}
-        else:
-            graph_obj = {'id': body['id'], 'graph': body['graph']}
-        # graph_obj = {'graph': json.loads(obj['graph'])}
-        # jsonMerged = {**body, **graph_obj}
-        # body = jsonMerged
-        # body.update(graph_obj)
-        body = graph_obj
-        ''''''
-        if obj is not None:
-            graph.delete_many({'id': body['id']})
-
-        obj = graph.insert(body)
+            json_data = body['graph']
+
+        obj = graph.replace_graph(body['id'], json_data)
 
         if obj is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
@@ -115,7 +102,7 @@ def save_interfaces_configuration():
         return Response(json.dumps(obj, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/interfaces/entity', methods=['POST'])
@@ -139,11 +126,7 @@ def add_entity():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['idScenario']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-        json_data['nodes'].append({
+        scen_graph = graph.add_element(body['idScenario'], 'nodes', {
             'id': db_utils.generate_uuid(),
             'name': body['name'],
             'external': body['external'],
@@ -154,17 +137,13 @@ def add_entity():
             'endpoints': []
         })
 
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['idScenario']}, scen_graph)
-
-        if result is None:
+        if scen_graph is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/interfaces/entity', methods=['PUT'])
@@ -188,32 +167,19 @@ def update_entity():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['idScenario']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-        n_list = json_data['nodes']
-        updated_name = body['name']
-        updated_descr = body['description']
-        updated_ext = body['external']
-        index_to_modify = next((i for i, n in enumerate(n_list) if n.get('id') == body['idFragment']), None)
-
-        if index_to_modify is not None:
-            json_data['nodes'][index_to_modify]['name'] = updated_name
-            json_data['nodes'][index_to_modify]['description'] = updated_descr
-            json_data['nodes'][index_to_modify]['external'] = updated_ext
-
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['idScenario']}, scen_graph)
-
-        if result is None:
+        scen_graph = graph.update_element(body['idScenario'], 'nodes', body['idFragment'], {
+            'name': body['name'],
+            'description': body['description'],
+            'external': body['external']
+        })
+
+        if scen_graph is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/interfaces/entity', methods=['DELETE'])
@@ -237,28 +203,14 @@ def delete_entity():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        nodes = body['graph']
-        json_data = json.loads(nodes)
-        n_list = json_data['nodes']
-        node = body['removedEntityId']
-        index_to_delete = next((i for i, n in enumerate(n_list) if n.get('id') == node), None)
-        print(f"Nodes before deletion: {n_list}")
-
-        if index_to_delete is not None:
-            del json_data['nodes'][index_to_delete]
-            del body['removedEntityId']
-
-        updated_graph_string = json.dumps(json_data)
-        body['graph'] = updated_graph_string
-
-        obj = graph.update_one({'id': body['id']}, body)
+        obj = graph.remove_element(body['id'], 'nodes', body['removedEntityId'])
         if obj is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         return Response(json.dumps(obj, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/interfaces/interface', methods=['POST'])
@@ -282,35 +234,27 @@ def add_interface():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['idScenario']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-        source = next((n for i, n in enumerate(json_data['nodes']) if n.get('id') == body['source']), None)
-        target = next((n for i, n in enumerate(json_data['nodes']) if n.get('id') == body['target']), None)
-        if source is not None and target is not None:
-            source_uuid = db_utils.generate_uuid()
-            if not 'endpoints' in source:
-                source['endpoints'] = []
-            source['endpoints'].append({
-                'id': source_uuid,
-                'uuid': source_uuid,
-                'type': 'source'
-            })
-            target_uuid = db_utils.generate_uuid()
-            if not 'endpoints' in target:
-                target['endpoints'] = []
-            target['endpoints'].append({
-                'id': target_uuid,
-                'uuid': target_uuid,
-                'type': 'target'
-            })
-            conn_id = db_utils.generate_uuid()
-            json_data['connections'].append({
-                'id': conn_id,
+
+        # The connection is based on the names of the nodes: retry it if the nodes are modified in the meantime
+        def connect():
+            nodes, revision = graph.find_elements(body['idScenario'], 'nodes', ['id', 'name'])
+            if nodes is None:
+                return None
+
+            source = next((n for i, n in enumerate(nodes) if n.get('id') == body['source']), None)
+            target = next((n for i, n in enumerate(nodes) if n.get('id') == body['target']), None)
+            if source is None or target is None:
+                return graph.find_graph(body['idScenario'])
+
+            source_ep = {'id': db_utils.generate_uuid(), 'type': 'source'}
+            source_ep['uuid'] = source_ep['id']
+            target_ep = {'id': db_utils.generate_uuid(), 'type': 'target'}
+            target_ep['uuid'] = target_ep['id']
+            connection = {
+                'id': db_utils.generate_uuid(),
                 'name': body['name'],
-                'source_ep_id': source_uuid,
-                'target_ep_id': target_uuid,
+                'source_ep_id': source_ep['id'],
+                'target_ep_id': target_ep['id'],
                 'source_entity_name': source['name'],
                 'target_entity_name': target['name'],
                 'impacted_elements': body['elements'],
@@ -319,19 +263,23 @@ def add_interface():
                 'content': body['content'],
                 'references': body['references'],
                 'notes': body['notes']
-            })
+            }
+            changes = [{'op': 'add', 'element': 'connections', 'id': connection['id']},
+                       {'op': 'update', 'element': 'nodes', 'id': source['id']},
+                       {'op': 'update', 'element': 'nodes', 'id': target['id']}]
+            return graph.update_graph(body['idScenario'], *connect_nodes(source['id'], source_ep, target['id'],
+                                                                         target_ep, connection), revision=revision,
+                                      changes=changes)
 
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['idScenario']}, scen_graph)
+        scen_graph = graph.retry(connect)
 
-        if result is None:
+        if scen_graph is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/interfaces/interface', methods=['PUT'])
@@ -355,31 +303,23 @@ def update_interface():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['idScenario']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-        for i, conn in enumerate(json_data['connections']):
-            if conn['id'] == body['id']:
-                conn['name'] = body['name']
-                conn['impacted_elements'] = body['elements']
-                conn['description'] = body['description']
-                conn['protocol'] = body['protocol']
-                conn['content'] = body['content']
-                conn['references'] = body['references']
-                conn['notes'] = body['notes']
-
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['idScenario']}, scen_graph)
-
-        if result is None:
+        scen_graph = graph.update_element(body['idScenario'], 'connections', body['id'], {
+            'name': body['name'],
+            'impacted_elements': body['elements'],
+            'description': body['description'],
+            'protocol': body['protocol'],
+            'content': body['content'],
+            'references': body['references'],
+            'notes': body['notes']
+        })
+
+        if scen_graph is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/interfaces/interface', methods=['DELETE'])
@@ -403,35 +343,33 @@ def delete_interface():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['idScenario']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-        source_ep_id = None
-        target_ep_id = None
-        for i, conn in enumerate(json_data['connections']):
-            if conn['id'] == body['idInterface']:
-                source_ep_id = conn['source_ep_id']
-                target_ep_id = conn['target_ep_id']
-                json_data['connections'].remove(conn)
-        for j, node in enumerate(json_data['nodes']):
-            if 'endpoints' not in node:
-                continue
-            for k, ep in enumerate(node['endpoints']):
-                if ep['id'] == source_ep_id or ep['id'] == target_ep_id:
-                    node['endpoints'].remove(ep)
-
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['idScenario']}, scen_graph)
-
-        if result is None:
+
+        # The endpoints to be removed are read from the connection: retry if it is modified in the meantime
+        def disconnect():
+            connections, revision = graph.find_elements(body['idScenario'], 'connections',
+                                                        ['id', 'source_ep_id', 'target_ep_id'])
+            if connections is None:
+                return None
+
+            ep_ids = []
+            for i, conn in enumerate(connections):
+                if conn['id'] == body['idInterface']:
+                    ep_ids += [conn['source_ep_id'], conn['target_ep_id']]
+            # The nodes owning the endpoints are not known: all the nodes are considered modified
+            changes = [{'op': 'delete', 'element': 'connections', 'id': body['idInterface']},
+                       {'op': 'update', 'element': 'nodes'}]
+            return graph.update_graph(body['idScenario'], *disconnect_nodes(body['idInterface'], ep_ids),
+                                      revision=revision, changes=changes)
+
+        scen_graph = graph.retry(disconnect)
+
+        if scen_graph is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/interfaces/commit/<config_id>', methods=['GET'])
@@ -443,19 +381,16 @@ def commit_by_config_id(config_id):
     """
     try:
 
+        # Only the versions metadata are listed, optionally paginated on the version number
         graph = Graph()
-        ver_graphs = graph.history_find({'id': config_id},
-                                        [('last_modify', pymongo.DESCENDING), ('tag', pymongo.ASCENDING),
-                                         ('n_ver', pymongo.ASCENDING)])
+        ver_graphs = graph.history_list(config_id, request.args.get('after_n_ver', type=int),
+                                        request.args.get('limit', default=0, type=int))
 
         if ver_graphs is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
         elif len(ver_graphs) == 0:
             return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
 
-        for i, version in enumerate(ver_graphs):
-            version['last_modify'] = version['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
-
         return Response(json.dumps(ver_graphs, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
@@ -473,18 +408,14 @@ def commit_by_config_id_and_n_ver(config_id, n_ver):
 
         graph = Graph()
         n_ver = int(n_ver)
-        ver_graphs = graph.history_find({'$and': [{'id': config_id}, {'n_ver': n_ver}]},
-                                        [('last_modify', pymongo.DESCENDING), ('n_ver', pymongo.ASCENDING)])
+        ver_graphs = graph.iter_history({'$and': [{'id': config_id}, {'n_ver': n_ver}]},
+                                        sort=[('last_modify', pymongo.DESCENDING), ('n_ver', pymongo.ASCENDING)])
 
-        if ver_graphs is None:
-            return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
-        elif len(ver_graphs) == 0:
+        first = next(ver_graphs, None)
+        if first is None:
             return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
 
-        for i, version in enumerate(ver_graphs):
-            version['last_modify'] = version['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
-
-        return Response(json.dumps(ver_graphs, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return http_utils.stream_json(format_version(version) for version in itertools.chain([first], ver_graphs))
 
     except Exception as ex:
         return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
@@ -500,23 +431,24 @@ def commit_by_config_id_and_tag(config_id, tag):
     try:
 
         graph = Graph()
-        ver_graphs = graph.history_find({'$and': [{'id': config_id}, {'tag': tag.upper()}]},
-                                        [('last_modify', pymongo.DESCENDING), ('n_ver', pymongo.ASCENDING)])
+        ver_graphs = graph.iter_history({'$and': [{'id': config_id}, {'tag': tag.upper()}]},
+                                        sort=[('last_modify', pymongo.DESCENDING), ('n_ver', pymongo.ASCENDING)])
 
-        if ver_graphs is None:
-            return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
-        elif len(ver_graphs) == 0:
+        first = next(ver_graphs, None)
+        if first is None:
             return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
 
-        for i, version in enumerate(ver_graphs):
-            version['last_modify'] = version['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
-
-        return Response(json.dumps(ver_graphs, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return http_utils.stream_json(format_version(version) for version in itertools.chain([first], ver_graphs))
 
     except Exception as ex:
         return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
 
+def format_version(version):
+    version['last_modify'] = version['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
+    return Graph.to_api(version)
+
+
 @blueprint.route('/rest/api/interfaces/commit', methods=['POST'])
 @login_required
 def commit_interfaces_configuration():
@@ -581,26 +513,43 @@ def upload_image(config_id, image_id):
 @login_required
 def download_interfaces_document(config_id):
     """
-    :param config_id:
-    :return:
-    :rtype:
+    Download the interfaces document of a configuration. The document is generated in the background (see the
+    documents jobs API): it is sent if already generated, otherwise the job generating it is returned, with status 202.
+    :param config_id: the configuration ID
+    :return: the document, or the job generating it
+    :rtype: Response
     """
+    import apps.routes.rest.documents.routes as documents_routes
+    return documents_routes.document_job_response('interfaces', config_id, download=True)
 
-    # Instantiate the report generator
-    word_doc_generator = WordGenerator(
-        'apps/docs/interfaces/[ESA-EOPG-EOPGC-IF-6] ESA EO Operations Framework (EOF) - CSC - Ground Segment Master '
-        'ICD - template.docx')
 
-    # Retrieve the configuration scenario
-    scenario = Scenario.get_scenario(config_id)
+def interfaces_document_key(config_id, scen_graph):
+    """
+    :param config_id: the configuration ID
+    :param scen_graph: the configuration document
+    :return: the key of the interfaces document in the document cache, identifying the configuration revision, the
+        template, the entity images and the code version the document is generated from
+    :rtype: str
+    """
+    document_cache = cache_utils.get_document_cache()
+    return document_cache.key(INTERFACES_DOCUMENT_VERSION, WordGenerator.VERSION, config_id,
+                              http_utils.document_etag(scen_graph),
+                              document_cache.file_hash(INTERFACES_TEMPLATE),
+                              document_cache.directory_hash('apps/docs/interfaces/' + config_id, '.png'))
+
+
+def generate_interfaces_document(config_id, json_data):
+    """
+    :param config_id: the configuration ID
+    :param json_data: the configuration graph
+    :return: the path of the generated document
+    :rtype: str
+    """
 
-    # Load the home graph
-    graph = Graph()
-    scen_graph = graph.find({'id': config_id})
-    scen_graph = scen_graph[0]
+    # Instantiate the report generator
+    word_doc_generator = WordGenerator(INTERFACES_TEMPLATE)
 
     # Collect all nodes and connections from the selected configuration
-    json_data = json.loads(scen_graph['graph'])
     nodes = json_data['nodes']
     connections = json_data['connections']
 
@@ -608,6 +557,7 @@ def download_interfaces_document(config_id):
     prev_paragraph = word_doc_generator.get_paragraph("CURRENT COPERNICUS MISSIONS")
 
     # For every node, dump a dedicated section, with the description of all connected interfaces
+    connections_by_node = index_connections(nodes, connections)
     for i, node in enumerate(nodes):
 
         # Skip external entities
@@ -616,24 +566,85 @@ def download_interfaces_document(config_id):
 
         # Given the current node, retrieve the corresponding image and select the relevant interfaces
         image_path = 'apps/docs/interfaces/' + config_id + '/' + node['id'] + '.png'
-        selected_connections = select_connections(node, connections)
+        selected_connections = connections_by_node[node['id']]
         dump_entity_description(word_doc_generator, prev_paragraph, node, image_path, selected_connections)
 
-    # Save and export the generated document
-    path = word_doc_generator.save(scenario.name)
-    return send_file(path, as_attachment=True)
+    # Save the generated document
+    return word_doc_generator.save()
 
 
-def select_connections(node, connections):
-    selected_connections = []
-    if 'endpoints' not in node:
-        return selected_connections
-    for ep in node['endpoints']:
-        for conn in connections:
-            if ep['id'] == conn['source_ep_id'] or ep['id'] == conn['target_ep_id']:
-                if conn not in selected_connections:
+def connect_nodes(source_id, source_ep, target_id, target_ep, connection):
+    """
+    Build the graph modification appending the source and target endpoints to the respective nodes and the
+    connection linking them.
+    :return: the update operators, the in-memory apply function and the array filters, as expected by
+        Graph.update_graph
+    :rtype: tuple
+    """
+    def apply(json_data):
+        for node in json_data['nodes']:
+            if node.get('id') == source_id:
+                node.setdefault('endpoints', []).append(source_ep)
+            if node.get('id') == target_id:
+                node.setdefault('endpoints', []).append(target_ep)
+        json_data.setdefault('connections', []).append(connection)
+
+    if source_id == target_id:
+        update = {'$push': {'graph.nodes.$[src].endpoints': {'$each': [source_ep, target_ep]},
+                            'graph.connections': connection}}
+        array_filters = [{'src.id': source_id}]
+    else:
+        update = {'$push': {'graph.nodes.$[src].endpoints': source_ep,
+                            'graph.nodes.$[tgt].endpoints': target_ep,
+                            'graph.connections': connection}}
+        array_filters = [{'src.id': source_id}, {'tgt.id': target_id}]
+    return update, apply, array_filters
+
+
+def disconnect_nodes(connection_id, ep_ids):
+    """
+    Build the graph modification removing the connection and the endpoints it links.
+    :return: the update operators, the in-memory apply function and the array filters, as expected by
+        Graph.update_graph
+    :rtype: tuple
+    """
+    def apply(json_data):
+        json_data['connections'] = [conn for conn in json_data['connections'] if conn['id'] != connection_id]
+        for node in json_data['nodes']:
+            if 'endpoints' in node:
+                node['endpoints'] = [ep for ep in node['endpoints'] if ep['id'] not in ep_ids]
+
+    update = {'$pull': {'graph.connections': {'id': connection_id},
+                        'graph.nodes.$[node].endpoints': {'id': {'$in': ep_ids}}}}
+    return update, apply, [{'node.endpoints': {'$type': 'array'}}]
+
+
+def index_connections(nodes, connections):
+    """
+    Select the connections of each node, i.e. the connections linking any endpoint of the node, in the order of the
+    node endpoints first, and then of the configuration connections.
+    :param nodes: the nodes of the configuration
+    :param connections: the connections of the configuration
+    :return: the connections of each node, by node ID
+    :rtype: dict
+    """
+    connections_by_endpoint = {}
+    for position, conn in enumerate(connections):
+        connections_by_endpoint.setdefault(conn['source_ep_id'], []).append((position, conn))
+        if conn['target_ep_id'] != conn['source_ep_id']:
+            connections_by_endpoint.setdefault(conn['target_ep_id'], []).append((position, conn))
+
+    connections_by_node = {}
+    for node in nodes:
+        selected_connections = []
+        selected_positions = set()
+        for ep in node.get('endpoints', []):
+            for position, conn in connections_by_endpoint.get(ep['id'], []):
+                if position not in selected_positions:
+                    selected_positions.add(position)
                     selected_connections.append(conn)
-    return selected_connections
+        connections_by_node[node['id']] = selected_connections
+    return connections_by_node
 
 
 def dump_entity_description(word_doc_generator, prev_paragraph, node, image_path, selected_connections):
@@ -643,39 +654,12 @@ def dump_entity_description(word_doc_generator, prev_paragraph, node, image_path
 
     # Add the interface table
     if selected_connections:
-        table_name = node['name'] + ' interfaces'
-        table = word_doc_generator.add_table(table_name, len(selected_connections) + 1, 9, par)
-        table.style = "Table Grid"
-        table.allow_autofit = True
         header_row = ['Interface Name', 'Satellite Unit(s)', 'Description', 'Service Source', 'Service Destination',
                       'Content', 'Protocol', 'References', 'Notes']
-        for i, header in enumerate(header_row):
-            word_doc_generator.add_text_to_cell_table(table_name, 0, i, header)
-            cell = table.rows[0].cells[i]
-            tblCell = cell._tc
-            tblCellProperties = tblCell.get_or_add_tcPr()
-            clShading = OxmlElement('w:shd')
-            clShading.set(qn('w:fill'), "B3ECF1")
-            tblCellProperties.append(clShading)
-            for paragraph in cell.paragraphs:
-                for run in paragraph.runs:
-                    run.font.bold = True
-                    run.font.size = Pt(9)
-        for j, conn in enumerate(selected_connections):
-            word_doc_generator.add_text_to_cell_table(table_name, j + 1, 0, conn['name'])
-            word_doc_generator.add_text_to_cell_table(table_name, j + 1, 1, conn['impacted_elements'])
-            word_doc_generator.add_text_to_cell_table(table_name, j + 1, 2, conn['description'])
-            word_doc_generator.add_text_to_cell_table(table_name, j + 1, 3, conn['source_entity_name'])
-            word_doc_generator.add_text_to_cell_table(table_name, j + 1, 4, conn['target_entity_name'])
-            word_doc_generator.add_text_to_cell_table(table_name, j + 1, 5, conn['content'])
-            word_doc_generator.add_text_to_cell_table(table_name, j + 1, 6, conn['protocol'])
-            word_doc_generator.add_text_to_cell_table(table_name, j + 1, 7, conn['references'])
-            word_doc_generator.add_text_to_cell_table(table_name, j + 1, 8, conn['notes'])
-            for k, col in enumerate(header_row):
-                cell = table.rows[j + 1].cells[k]
-                for paragraph in cell.paragraphs:
-                    for run in paragraph.runs:
-                        run.font.size = Pt(9)
+        rows = [[conn['name'], conn['impacted_elements'], conn['description'], conn['source_entity_name'],
+                 conn['target_entity_name'], conn['content'], conn['protocol'], conn['references'], conn['notes']]
+                for conn in selected_connections]
+        word_doc_generator.write_table(node['name'] + ' interfaces', header_row, rows, "Table Grid", par)
 
     # Add the node picture
     if os.path.isfile(image_path):
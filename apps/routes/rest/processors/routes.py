@@ -37,6 +37,7 @@ from flask_login import login_required
 
 import apps.utils.auth_utils as auth_utils
 import apps.utils.db_utils as db_utils
+import apps.utils.http_utils as http_utils
 from apps.models.nosql.Graph import Graph
 from apps.routes.rest.processors import blueprint
 
@@ -46,9 +47,11 @@ from apps.routes.rest.processors import blueprint
 def get_processors_releases(config_id):
     try:
         graph = Graph()
-        scen_graph = graph.find({'id': config_id})
-        scen_graph = scen_graph[0]
-        return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        raw = request.args.get('format') == 'raw'
+        scen_graph, content = graph.serialize_graph(config_id, raw)
+        if scen_graph is None:
+            return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.document_response(scen_graph, content, 'raw' if raw else None)
     except Exception as ex:
         return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
@@ -74,15 +77,7 @@ def add_processor_release():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['config_id']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-
-        if 'processors_releases' not in json_data:
-            json_data['processors_releases'] = []
-
-        json_data['processors_releases'].append({
+        result = graph.add_element(body['config_id'], 'processors_releases', {
             'id': db_utils.generate_uuid(),
             'mission': body['mission'],
             'satellite_units': body['satellite_units'],
@@ -94,17 +89,13 @@ def add_processor_release():
             'release_notes': body['release_notes']
         })
 
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['config_id']}, scen_graph)
-
         if result is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
-        return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return Response(json.dumps(result, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/processors-releases', methods=['PUT'])
@@ -128,33 +119,24 @@ def update_processor_release():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['config_id']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-
-        for index, processor in enumerate(json_data['processors_releases']):
-            if processor['id'] == body['id']:
-                processor['mission'] = body['mission']
-                processor['satellite_units'] = body['satellite_units']
-                processor['target_ipfs'] = body['target_ipfs']
-                processor['processing_baseline'] = body['processing_baseline']
-                processor['release_date'] = body['release_date']
-                processor['validity_start_date'] = body['validity_start_date']
-                processor['validity_end_date'] = body['validity_end_date']
-                processor['release_notes'] = body['release_notes']
-
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['config_id']}, scen_graph)
+        result = graph.update_element(body['config_id'], 'processors_releases', body['id'], {
+            'mission': body['mission'],
+            'satellite_units': body['satellite_units'],
+            'target_ipfs': body['target_ipfs'],
+            'processing_baseline': body['processing_baseline'],
+            'release_date': body['release_date'],
+            'validity_start_date': body['validity_start_date'],
+            'validity_end_date': body['validity_end_date'],
+            'release_notes': body['release_notes']
+        })
 
         if result is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
-        return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return Response(json.dumps(result, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/processors-releases', methods=['DELETE'])
@@ -178,18 +160,7 @@ def delete_processor_release():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['config_id']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-
-        for index, processor in enumerate(json_data['processors_releases']):
-            if processor['id'] == body['processor_release_id']:
-                json_data['processors_releases'].remove(processor);
-
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['config_id']}, scen_graph)
+        result = graph.remove_element(body['config_id'], 'processors_releases', body['processor_release_id'])
 
         if result is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
@@ -197,4 +168,4 @@ def delete_processor_release():
         return Response(json.dumps(result, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
\ No newline at end of file
+        return http_utils.error_response(ex)
\ No newline at end of file
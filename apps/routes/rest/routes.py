@@ -28,10 +28,14 @@ __status__ = "Production"
 __version__ = "1.0.0"
 
 import json
+import os
+import threading
+import time
 from datetime import datetime
 
 from flask import Response
 from flask import request
+from flask import stream_with_context
 from flask_login import login_required
 from sqlalchemy import JSON, false
 
@@ -39,12 +43,15 @@ from apps.routes.rest import blueprint
 from apps.models.nosql.Graph import Graph
 import apps.utils.auth_utils as auth_utils
 import apps.utils.db_utils as db_utils
+import apps.utils.http_utils as http_utils
 from flask_login import current_user
 import apps.models.sql.Fragment as Fragment
 import apps.models.sql.Scenario as Scenario
 import apps.models.sql.Users as Users
 import apps.models.sql.UserRole as UserRole
-import pymongo
+
+# Each event stream holds a worker thread for its whole duration: their number is limited in each process
+EVENT_STREAMS = threading.BoundedSemaphore(int(os.getenv('SSE_MAX_STREAMS', 10)))
 
 
 @blueprint.route('/rest/api/configurations', methods=['GET'])
@@ -58,51 +65,197 @@ def get_configurations():
 
         # Retrieve the available configurations from the Postgres DB, given the user id
         scenarios = Scenario.get_scenarios()
+        ids = [scenario.id for scenario in scenarios]
 
-        # Loop over each home, and retrieve from Mongo DB the information about last modifications and versioning
-        for i, scenario in enumerate(scenarios):
-            id = scenario.id
+        # Retrieve from Mongo DB the information about last modifications and versioning of all the configurations
+        graph = Graph()
+        last_modify = {document['id']: document['last_modify'] for document in
+                       graph.iter_find({'id': {'$in': ids}}, {'_id': 0, 'id': 1, 'last_modify': 1})}
+        versions = graph.history_summary(ids)
 
-            # Retrieve the graph
-            graph = Graph()
-            scen_graph = graph.find({'id': id})
-            scen_graph = scen_graph[0]
-            scen_graph['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
+        for i, scenario in enumerate(scenarios):
 
-            # Add description to Processors configuration
+            # Add description to Processors configuration (in the response only)
             if scenario.name == 'Interfaces':
                 scenario.description = 'The CSC Ground Segment interfaces configuration'
-                Scenario.update_scenario(scenario.id, scenario.name, scenario.description, scenario.startDate,
-                                         scenario.endDate, scenario.increaseTime, scenario.locked)
             if scenario.name == 'Processors':
                 scenario.description = ('The historical and the up-to-date configuration of the releases of the '
                                         'Copernicus Sentinels processors')
-                Scenario.update_scenario(scenario.id, scenario.name, scenario.description, scenario.startDate,
-                                         scenario.endDate, scenario.increaseTime, scenario.locked)
-
-            # Retrieve versioning history
-            ver_graphs = graph.history_find({'id': id},
-                                            [('n_ver', pymongo.DESCENDING)])
-            tagged_ver = {}
-            for i, version in enumerate(ver_graphs):
-                if 'tag' in version and version['tag']:
-                    tagged_ver = version
-                    break
 
             # Enrich the home object with the additional information about versioning
-            scenario.last_modify = scen_graph['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
-            if ver_graphs is not None and len(ver_graphs) > 0:
-                scenario.last_commit = ver_graphs[0]['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
-                scenario.comment = ver_graphs[0]['comment']
-            if tagged_ver is not None and 'tag' in tagged_ver:
-                scenario.last_tag = tagged_ver['tag']
+            if scenario.id in last_modify:
+                scenario.last_modify = last_modify[scenario.id].strftime("%d/%m/%Y, %H:%M:%S")
+            if scenario.id in versions:
+                scenario.last_commit = versions[scenario.id]['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
+                scenario.comment = versions[scenario.id]['comment']
+                if versions[scenario.id]['tag']:
+                    scenario.last_tag = versions[scenario.id]['tag']
+
+        # The list aggregates Postgres and Mongo data, without a common modification date: it is validated with the
+        # hash of its content only
+        return http_utils.conditional_json(scenarios)
+
+    except Exception as ex:
+        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+
+
+@blueprint.route('/rest/api/configurations/<config_id>/batch', methods=['POST'])
+@login_required
+def apply_configuration_batch(config_id):
+    """
+    Apply an ordered list of add / update / delete operations on the elements of the configuration graph (services,
+    interfaces, nodes, connections and processors releases) in a single request, e.g.:
+    {"operations": [{"op": "update", "element": "services", "id": "...", "fields": {"external": true}}, ...]}
+    Elements added without an ID are assigned a new one.
+    :param config_id: the configuration ID
+    :return: the updated configuration graph and the result of each operation
+    :rtype: Response
+    """
+    try:
+        if not auth_utils.is_user_authorized(['admin']):
+            return Response(json.dumps("Not authorized", cls=db_utils.AlchemyEncoder), mimetype="application/json",
+                            status=401)
+        body = None
+        if request.data != b'':
+            body = json.loads(request.data.decode('utf-8'))
+        if body is None or not isinstance(body.get('operations'), list):
+            return Response(json.dumps({'error': '400'}), mimetype="application/json", status=400)
+
+        operations = body['operations']
+        for operation in operations:
+            if isinstance(operation, dict) and operation.get('op') == 'add':
+                fields = operation.get('fields') or {}
+                if operation.get('id', fields.get('id') if isinstance(fields, dict) else None) is None:
+                    operation['id'] = db_utils.generate_uuid()
+
+        graph = Graph()
+        scen_graph, results = graph.apply_batch(config_id, operations)
+        if scen_graph is None:
+            return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
+
+        return Response(json.dumps({'graph': scen_graph, 'results': results}, cls=db_utils.AlchemyEncoder),
+                        mimetype="application/json", status=200)
+
+    except Exception as ex:
+        return http_utils.error_response(ex)
+
+
+@blueprint.route('/rest/api/configurations/<config_id>/changes', methods=['GET'])
+@login_required
+def get_configuration_changes(config_id):
+    """
+    Retrieve the elements of the configuration graph added, updated and removed after the revision given in the
+    'since' parameter, or the whole graph, if the changes are not available anymore (see Graph.changes_since).
+    :param config_id: the configuration ID
+    :return: the changes of the configuration
+    :rtype: Response
+    """
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return Response(json.dumps({'error': '400'}), mimetype="application/json", status=400)
+
+        graph = Graph()
+        changes = graph.changes_since(config_id, since)
+        if changes is None:
+            return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
+
+        return http_utils.conditional_json(changes)
+
+    except Exception as ex:
+        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+
+
+@blueprint.route('/rest/api/configurations/<config_id>/events', methods=['GET'])
+@login_required
+def stream_configuration_events(config_id):
+    """
+    Stream the changes of the configuration as server-sent events:
+    - 'revision': the current revision of the configuration, sent upon connection
+    - 'change': a new revision, with the list of the modified elements (see Graph.update_graph)
+    - 'reset': some changes are not available anymore; the whole configuration shall be reloaded
+    The ID of each event is the revision of the configuration: upon reconnection, the stream is resumed from the
+    revision given in the Last-Event-ID header (or in the 'since' parameter). Each stream is closed after
+    SSE_MAX_DURATION seconds, and the client reconnects automatically.
+    Each open stream holds a thread of the (threaded) gunicorn worker: at most SSE_MAX_STREAMS streams are served by
+    each worker, on the threads reserved to them in addition to those serving the other requests (see gunicorn-cfg.py).
+    :param config_id: the configuration ID
+    :return: the event stream
+    :rtype: Response
+    """
+    try:
+        graph = Graph()
+        scen_graph = graph.find_graph(config_id)
+        if scen_graph is None:
+            return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
 
-        return Response(json.dumps(scenarios, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        since = request.headers.get('Last-Event-ID', request.args.get('since'))
+        revision = int(since) if since is not None else scen_graph.get('revision', 0)
+        return Response(stream_with_context(configuration_events(graph, config_id, revision, since is None)),
+                        mimetype="text/event-stream", headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
     except Exception as ex:
         return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
 
+def configuration_events(graph, config_id, revision, announce):
+    """
+    Generate the server-sent events of the changes of a configuration, starting after the given revision.
+    :param graph: the Graph document
+    :param config_id: the configuration ID
+    :param revision: the revision already known by the client
+    :param announce: whether the revision is sent to the client upon connection
+    :return: the events generator
+    """
+    retry = int(os.getenv('SSE_RETRY_MS', 5000))
+    if not EVENT_STREAMS.acquire(blocking=False):
+
+        # Too many streams in this process: ask the client to reconnect later
+        yield 'retry: {}\n\n'.format(int(os.getenv('SSE_BUSY_RETRY_MS', 30000)))
+        if announce:
+            yield http_utils.sse_event({'revision': revision}, 'revision', revision)
+        return
+
+    try:
+        yield 'retry: {}\n\n'.format(retry)
+        if announce:
+            yield http_utils.sse_event({'revision': revision}, 'revision', revision)
+
+        deadline = time.monotonic() + float(os.getenv('SSE_MAX_DURATION', 300))
+        heartbeat = float(os.getenv('SSE_HEARTBEAT', 15))
+        last_sent = time.monotonic()
+        gap_since = None
+        while time.monotonic() < deadline:
+            for entry in graph.find_changes(config_id, revision, 100):
+
+                # The changes are logged right after the modifications, possibly out of order: wait a while for the
+                # missing revisions, before giving up on them
+                if entry['revision'] != revision + 1:
+                    gap_since = gap_since if gap_since is not None else time.monotonic()
+                    if time.monotonic() - gap_since < float(os.getenv('SSE_GAP_TIMEOUT', 5)):
+                        break
+                    yield http_utils.sse_event({'revision': entry['revision']}, 'reset', entry['revision'])
+                else:
+                    yield http_utils.sse_event({
+                        'revision': entry['revision'],
+                        'changes': entry['changes'],
+                        'last_modify': entry['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
+                        if isinstance(entry['last_modify'], datetime) else None
+                    }, 'change', entry['revision'])
+                gap_since = None
+                revision = entry['revision']
+                last_sent = time.monotonic()
+
+            if time.monotonic() - last_sent >= heartbeat:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+
+            # Changes logged by this process wake up the stream immediately; the others are polled
+            Graph.wait_changes(float(os.getenv('SSE_POLL_INTERVAL', 1)))
+    finally:
+        EVENT_STREAMS.release()
+
+
 @blueprint.route('/rest/api/configurations', methods=['POST'])
 @login_required
 def save_configuration():
@@ -127,7 +280,7 @@ def save_configuration():
             # Create a configuration document
             # The ID of the document shall match the configuration UUID
             graph = Graph()
-            graph.insert_one({'id': uuid, 'graph':'{}'})
+            graph.insert_one({'id': uuid, 'graph': graph.new_graph()})
 
             return Response(json.dumps({'id': uuid}), mimetype="application/json", status=200)
         return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
@@ -27,47 +27,61 @@ __license__ = "GPLv3"
 __status__ = "Production"
 __version__ = "1.0.0"
 
+import itertools
 import json
 
 import docx
 import html2text
 import pymongo
-from docx.oxml.ns import qn
-from docx.oxml import parse_xml, OxmlElement
+from docx.oxml import parse_xml
 from docx.oxml.ns import nsdecls
-from docx.shared import Pt, Inches
-from flask import Response, send_file
+from docx.shared import Inches
+from flask import Response
 from flask import request
 from flask_login import login_required
 
 import apps.utils.auth_utils as auth_utils
+import apps.utils.cache_utils as cache_utils
 import apps.utils.db_utils as db_utils
+import apps.utils.http_utils as http_utils
 from apps.models.nosql.Graph import Graph
-from apps.models.sql import Scenario
 from apps.routes.rest.services import blueprint
 from apps.utils.word_document_generator import WordGenerator
 
+SERVICES_TEMPLATE = 'apps/docs/services/CSC_ESA_Operational_Configuration - template.docx'
+
+# The version of the services document generation, part of the document cache key: to be increased whenever a code
+# change alters the generated document, so that the documents generated by the previous code are not served anymore
+SERVICES_DOCUMENT_VERSION = 1
+
 
 @blueprint.route('/rest/api/services/<config_id>', methods=['GET'])
 @login_required
 def get_services(config_id):
     try:
         graph = Graph()
-        scen_graph = graph.find({'id': config_id})
-        scen_graph = scen_graph[0]
-
-        # Add the external field in the model
-        json_data = json.loads(scen_graph['graph'])
-        for index, service in enumerate(json_data['services']):
-            if 'external' not in service:
-                service['external'] = False
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': config_id}, scen_graph)
-
-        return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        json_data = graph.load_graph(config_id)
+        if json_data is None:
+            return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+
+        # Add the external field in the model, only if missing in some service
+        if any('external' not in service for service in json_data.get('services', [])):
+            def apply(json_data):
+                for service in json_data['services']:
+                    if 'external' not in service:
+                        service['external'] = False
+
+            graph.update_graph(config_id, {'$set': {'graph.services.$[elem].external': False}}, apply,
+                               [{'elem.external': {'$exists': False}}],
+                               changes=[{'op': 'update', 'element': 'services'}])
+
+        raw = request.args.get('format') == 'raw'
+        scen_graph, content = graph.serialize_graph(config_id, raw)
+        if scen_graph is None:
+            return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.document_response(scen_graph, content, 'raw' if raw else None)
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/services', methods=['POST'])
@@ -91,15 +105,7 @@ def add_service():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['config_id']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-
-        if 'services' not in json_data:
-            json_data['services'] = []
-
-        json_data['services'].append({
+        result = graph.add_element(body['config_id'], 'services', {
             'id': db_utils.generate_uuid(),
             'type': body['type'],
             'provider': body['provider'],
@@ -112,17 +118,13 @@ def add_service():
             'references': body['references']
         })
 
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['config_id']}, scen_graph)
-
         if result is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
-        return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return Response(json.dumps(result, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/services', methods=['PUT'])
@@ -146,34 +148,25 @@ def update_service():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['config_id']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-
-        for index, service in enumerate(json_data['services']):
-            if service['id'] == body['id']:
-                service['type'] = body['type']
-                service['provider'] = body['provider']
-                service['external'] = body['external']
-                service['satellite_units'] = body['satellite_units']
-                service['interface_point'] = body['interface_point']
-                service['cloud_provider'] = body['cloud_provider']
-                service['rolling_period'] = body['rolling_period']
-                service['operational_ipfs'] = body['operational_ipfs']
-                service['references'] = body['references']
-
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['config_id']}, scen_graph)
+        result = graph.update_element(body['config_id'], 'services', body['id'], {
+            'type': body['type'],
+            'provider': body['provider'],
+            'external': body['external'],
+            'satellite_units': body['satellite_units'],
+            'interface_point': body['interface_point'],
+            'cloud_provider': body['cloud_provider'],
+            'rolling_period': body['rolling_period'],
+            'operational_ipfs': body['operational_ipfs'],
+            'references': body['references']
+        })
 
         if result is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
-        return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return Response(json.dumps(result, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/services', methods=['DELETE'])
@@ -197,18 +190,7 @@ def delete_service():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['config_id']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-
-        for index, service in enumerate(json_data['services']):
-            if service['id'] == body['service_id']:
-                json_data['services'].remove(service)
-
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['config_id']}, scen_graph)
+        result = graph.remove_element(body['config_id'], 'services', body['service_id'])
 
         if result is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
@@ -216,7 +198,7 @@ def delete_service():
         return Response(json.dumps(result, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/services/interfaces', methods=['POST'])
@@ -240,15 +222,7 @@ def add_service_interface():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['config_id']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-
-        if 'interfaces' not in json_data:
-            json_data['interfaces'] = []
-
-        json_data['interfaces'].append({
+        result = graph.add_element(body['config_id'], 'interfaces', {
             'id': db_utils.generate_uuid(),
             'source_service_id': body['source_service_id'],
             'target_service_id': body['target_service_id'],
@@ -256,17 +230,13 @@ def add_service_interface():
             'status': body['status']
         })
 
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['config_id']}, scen_graph)
-
         if result is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
-        return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return Response(json.dumps(result, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/services/interfaces', methods=['PUT'])
@@ -290,29 +260,20 @@ def update_service_interface():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['config_id']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-
-        for index, interface in enumerate(json_data['interfaces']):
-            if interface['id'] == body['id']:
-                interface['source_service_id'] = body['source_service_id']
-                interface['target_service_id'] = body['target_service_id']
-                interface['satellite_units'] = body['satellite_units']
-                interface['status'] = body['status']
-
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['config_id']}, scen_graph)
+        result = graph.update_element(body['config_id'], 'interfaces', body['id'], {
+            'source_service_id': body['source_service_id'],
+            'target_service_id': body['target_service_id'],
+            'satellite_units': body['satellite_units'],
+            'status': body['status']
+        })
 
         if result is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
-        return Response(json.dumps(scen_graph, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return Response(json.dumps(result, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/services/interfaces', methods=['DELETE'])
@@ -336,18 +297,7 @@ def delete_service_interface():
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
         graph = Graph()
-        scen_graph = graph.find({'id': body['config_id']})
-        scen_graph = scen_graph[0]
-
-        json_data = json.loads(scen_graph['graph'])
-
-        for index, interface in enumerate(json_data['interfaces']):
-            if interface['id'] == body['interface_id']:
-                json_data['interfaces'].remove(interface)
-
-        updated_graph_string = json.dumps(json_data)
-        scen_graph['graph'] = updated_graph_string
-        result = graph.update_one({'id': body['config_id']}, scen_graph)
+        result = graph.remove_element(body['config_id'], 'interfaces', body['interface_id'])
 
         if result is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
@@ -355,7 +305,7 @@ def delete_service_interface():
         return Response(json.dumps(result, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
-        return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+        return http_utils.error_response(ex)
 
 
 @blueprint.route('/rest/api/services/commit/<config_id>', methods=['GET'])
@@ -367,17 +317,14 @@ def commit_by_config_id(config_id):
     """
     try:
 
+        # Only the versions metadata are listed, optionally paginated on the version number
         graph = Graph()
-        ver_graphs = graph.history_find({'id': config_id},
-                                        [('last_modify', pymongo.DESCENDING), ('tag', pymongo.ASCENDING),
-                                         ('n_ver', pymongo.ASCENDING)])
+        ver_graphs = graph.history_list(config_id, request.args.get('after_n_ver', type=int),
+                                        request.args.get('limit', default=0, type=int))
 
         if ver_graphs is None:
             return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
-        for i, version in enumerate(ver_graphs):
-            version['last_modify'] = version['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
-
         return Response(json.dumps(ver_graphs, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
 
     except Exception as ex:
@@ -395,18 +342,14 @@ def commit_by_config_id_and_n_ver(config_id, n_ver):
 
         graph = Graph()
         n_ver = int(n_ver)
-        ver_graphs = graph.history_find({'$and': [{'id': config_id}, {'n_ver': n_ver}]},
-                                        [('last_modify', pymongo.DESCENDING), ('n_ver', pymongo.ASCENDING)])
+        ver_graphs = graph.iter_history({'$and': [{'id': config_id}, {'n_ver': n_ver}]},
+                                        sort=[('last_modify', pymongo.DESCENDING), ('n_ver', pymongo.ASCENDING)])
 
-        if ver_graphs is None:
-            return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
-        elif len(ver_graphs) == 0:
+        first = next(ver_graphs, None)
+        if first is None:
             return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
 
-        for i, version in enumerate(ver_graphs):
-            version['last_modify'] = version['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
-
-        return Response(json.dumps(ver_graphs, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return http_utils.stream_json(format_version(version) for version in itertools.chain([first], ver_graphs))
 
     except Exception as ex:
         return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
@@ -422,23 +365,24 @@ def commit_by_config_id_and_tag(config_id, tag):
     try:
 
         graph = Graph()
-        ver_graphs = graph.history_find({'$and': [{'id': config_id}, {'tag': tag.upper()}]},
-                                        [('last_modify', pymongo.DESCENDING), ('n_ver', pymongo.ASCENDING)])
+        ver_graphs = graph.iter_history({'$and': [{'id': config_id}, {'tag': tag.upper()}]},
+                                        sort=[('last_modify', pymongo.DESCENDING), ('n_ver', pymongo.ASCENDING)])
 
-        if ver_graphs is None:
-            return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
-        elif len(ver_graphs) == 0:
+        first = next(ver_graphs, None)
+        if first is None:
             return Response(json.dumps({'error': '404'}), mimetype="application/json", status=404)
 
-        for i, version in enumerate(ver_graphs):
-            version['last_modify'] = version['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
-
-        return Response(json.dumps(ver_graphs, cls=db_utils.AlchemyEncoder), mimetype="application/json", status=200)
+        return http_utils.stream_json(format_version(version) for version in itertools.chain([first], ver_graphs))
 
     except Exception as ex:
         return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
 
 
+def format_version(version):
+    version['last_modify'] = version['last_modify'].strftime("%d/%m/%Y, %H:%M:%S")
+    return Graph.to_api(version)
+
+
 @blueprint.route('/rest/api/services/commit', methods=['POST'])
 @login_required
 def commit_interfaces_configuration():
@@ -472,36 +416,54 @@ def commit_interfaces_configuration():
 @login_required
 def download_services_document(config_id):
     """
-    :param config_id:
-    :return:
-    :rtype:
+    Download the services document of a configuration. The document is generated in the background (see the
+    documents jobs API): it is sent if already generated, otherwise the job generating it is returned, with status 202.
+    :param config_id: the configuration ID
+    :return: the document, or the job generating it
+    :rtype: Response
     """
+    import apps.routes.rest.documents.routes as documents_routes
+    return documents_routes.document_job_response('services', config_id, download=True)
 
-    # Instantiate the report generator
-    word_doc_generator = WordGenerator('apps/docs/services/CSC_ESA_Operational_Configuration - template.docx')
 
-    # Retrieve the configuration scenario
-    scenario = Scenario.get_scenario(config_id)
+def services_document_key(config_id, scen_graph):
+    """
+    :param config_id: the configuration ID
+    :param scen_graph: the configuration document
+    :return: the key of the services document in the document cache, identifying the configuration revision, the
+        template and the code version the document is generated from
+    :rtype: str
+    """
+    document_cache = cache_utils.get_document_cache()
+    return document_cache.key(SERVICES_DOCUMENT_VERSION, WordGenerator.VERSION, config_id,
+                              http_utils.document_etag(scen_graph),
+                              document_cache.file_hash(SERVICES_TEMPLATE))
 
-    # Load the home graph
-    graph = Graph()
-    scen_graph = graph.find({'id': config_id})
-    scen_graph = scen_graph[0]
+
+def generate_services_document(config_id, json_data):
+    """
+    :param config_id: the configuration ID
+    :param json_data: the configuration graph
+    :return: the path of the generated document
+    :rtype: str
+    """
+
+    # Instantiate the report generator
+    word_doc_generator = WordGenerator(SERVICES_TEMPLATE)
 
     # Collect all nodes and connections from the selected configuration
-    json_data = json.loads(scen_graph['graph'])
     services = json_data['services']
     interfaces = json_data['interfaces']
     dump_services_description(word_doc_generator, services)
 
     # Add a dedicated section with the interfaces matrix for each satellite
     satellites = ['S5P', 'S3B', 'S3A', 'S2B', 'S2A', 'S1A']
+    services_by_satellite, interfaces_by_link = index_interfaces_matrix(services, interfaces, satellites)
     for i, satellite in enumerate(satellites):
-        dump_interfaces_matrix(word_doc_generator, satellite, services, interfaces)
+        dump_interfaces_matrix(word_doc_generator, satellite, services_by_satellite[satellite], interfaces_by_link)
 
-    # Save and export the generated document
-    path = word_doc_generator.save(scenario.name)
-    return send_file(path, as_attachment=True)
+    # Save the generated document
+    return word_doc_generator.save()
 
 
 def dump_services_description(word_doc_generator, services):
@@ -516,43 +478,44 @@ def dump_services_description(word_doc_generator, services):
     word_doc_generator.set_section_width_height(2, 10692130, 7560310)
 
     # Append table
-    table_name = 'Services list'
-    table = word_doc_generator.add_table(table_name, len(services) + 1, 8, par)
-    table.style = "Table Grid"
-    table.allow_autofit = True
     header_row = ['Service Type', 'Service Provider', 'Satellite Unit(s)', 'Interface Point', 'Cloud Provider',
                   'Rolling Period [days]', 'Operational IPFs', 'References']
-    for i, header in enumerate(header_row):
-        word_doc_generator.add_text_to_cell_table(table_name, 0, i, header)
-        cell = table.rows[0].cells[i]
-        tblCell = cell._tc
-        tblCellProperties = tblCell.get_or_add_tcPr()
-        clShading = OxmlElement('w:shd')
-        clShading.set(qn('w:fill'), "B3ECF1")
-        tblCellProperties.append(clShading)
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-                run.font.size = Pt(9)
-    for j, service in enumerate(services):
-        word_doc_generator.add_text_to_cell_table(table_name, j + 1, 0, service['type'])
-        word_doc_generator.add_text_to_cell_table(table_name, j + 1, 1, service['provider'])
-        word_doc_generator.add_text_to_cell_table(table_name, j + 1, 2, service['satellite_units'])
-        word_doc_generator.add_text_to_cell_table(table_name, j + 1, 3, service['interface_point'])
-        word_doc_generator.add_text_to_cell_table(table_name, j + 1, 4, service['cloud_provider'])
-        word_doc_generator.add_text_to_cell_table(table_name, j + 1, 5, service['rolling_period'])
-        word_doc_generator.add_text_to_cell_table(table_name, j + 1, 6, service['operational_ipfs'])
-        word_doc_generator.add_text_to_cell_table(table_name, j + 1, 7, service['references'])
-        for k, col in enumerate(header_row):
-            cell = table.rows[j + 1].cells[k]
-            for paragraph in cell.paragraphs:
-                for run in paragraph.runs:
-                    run.font.size = Pt(9)
+    rows = [[service['type'], service['provider'], service['satellite_units'], service['interface_point'],
+             service['cloud_provider'], service['rolling_period'], service['operational_ipfs'], service['references']]
+            for service in services]
+    word_doc_generator.write_table('Services list', header_row, rows, "Table Grid", par)
 
     return
 
 
-def dump_interfaces_matrix(word_doc_generator, satellite, services, interfaces):
+def index_interfaces_matrix(services, interfaces, satellites):
+    """
+    Index the services and the interfaces once for all the interfaces matrices of the document.
+    :param services: the services of the configuration
+    :param interfaces: the interfaces of the configuration
+    :param satellites: the satellites having an interfaces matrix
+    :return: the services relevant to each satellite, sorted by service type, and the interface linking each couple
+        of (source, target) services
+    :rtype: tuple
+    """
+    services_by_satellite = {satellite: [] for satellite in satellites}
+    for service in services:
+        satellite_units = [x.strip() for x in service['satellite_units'].split(',')]
+        for satellite in satellites:
+            if satellite in service['satellite_units'] or satellite[:2] in satellite_units:
+                services_by_satellite[satellite].append(service)
+
+    # Sort services on the basis of the service type
+    for filtered_services in services_by_satellite.values():
+        filtered_services.sort(key=lambda service: service['type'])
+
+    # In case of multiple interfaces between the same services, the last one is shown
+    interfaces_by_link = {(iff['source_service_id'], iff['target_service_id']): iff for iff in interfaces}
+
+    return services_by_satellite, interfaces_by_link
+
+
+def dump_interfaces_matrix(word_doc_generator, satellite, filtered_services, interfaces_by_link):
 
     # Retrieve the last paragraph
     prev_paragraph = word_doc_generator.get_paragraph("CSC INTERFACE MATRIX")
@@ -567,71 +530,43 @@ def dump_interfaces_matrix(word_doc_generator, satellite, services, interfaces):
     # Increment level, to create a new child section
     par = word_doc_generator.add_paragraph_after(prev_paragraph, heading_name[satellite] + ' Interfaces Matrix', 'Heading02')
 
-    # Collect services relevant to the selected satellite
-    filtered_services = [service for service in services if satellite in service['satellite_units'] or
-                         satellite[:2] in [x.strip() for x in service['satellite_units'].split(',')]]
-
-    # Sort services on the basis of the service type
-    filtered_services.sort(key=lambda service: service['type'])
-
     # Initialize the interface matrix
     table_name = satellite + ' interface matrix'
     table = word_doc_generator.add_table(table_name, len(filtered_services) + 1, len(filtered_services) + 1, par)
     table.style = "Table Grid"
     table.allow_autofit = True
+    cells = word_doc_generator.get_table_cells(table_name)
 
-    # Set the font size and alignment in whole table
-    for row in table.rows:
-        for cell in row.cells:
+    # Set the alignment in whole table
+    for row_cells in cells:
+        for cell in row_cells:
             cell.vertical_alignment = docx.enum.table.WD_ALIGN_VERTICAL.CENTER
-            paragraphs = cell.paragraphs
-            for paragraph in paragraphs:
+            for paragraph in cell.paragraphs:
                 paragraph.alignment = docx.enum.text.WD_PARAGRAPH_ALIGNMENT.CENTER
-                for run in paragraph.runs:
-                    run.font.size = Pt(9)
 
     # Add from / to services labels
+    positions = {}
     for i, service in enumerate(filtered_services):
+        positions.setdefault(service['id'], []).append(i + 1)
+        label = service['type'][:3] + ' - ' + service['provider']
 
-        # Horizontal row with labels
-        word_doc_generator.add_text_to_cell_table(table_name, 0, i + 1,
-                                                  service['type'][:3] + ' - ' + service['provider'])
-        cell = table.rows[0].cells[i + 1]
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-                run.font.size = Pt(9)
+        # Horizontal row and vertical column with labels
+        for cell in (cells[0][i + 1], cells[i + 1][0]):
+            word_doc_generator.add_text_to_cell(cell, label, True)
             if service['external']:
                 shading_elm = parse_xml(r'<w:shd {} w:fill="EE6B6E"/>'.format(nsdecls('w')))
                 cell._tc.get_or_add_tcPr().append(shading_elm)
 
-        # Vertical column with labels
-        word_doc_generator.add_text_to_cell_table(table_name, i + 1, 0,
-                                                  service['type'][:3] + ' - ' + service['provider'])
-        cell = table.rows[i + 1].cells[0]
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-                run.font.size = Pt(9)
-        if service['external']:
-            shading_elm = parse_xml(r'<w:shd {} w:fill="EE6B6E"/>'.format(nsdecls('w')))
-            cell._tc.get_or_add_tcPr().append(shading_elm)
-
     # Populate interface matrix with values
-    # Loop over the interfaces, and fill the cells corresponding to the row / col
-    for i, service_row in enumerate(filtered_services):
-        for j, service_col in enumerate(filtered_services):
-            for iff in interfaces:
-                if iff['source_service_id'] == service_row['id'] and iff['target_service_id'] == service_col['id']:
-                    val = '1' if iff['status'] == 'Operational' else '2'
-                    cell = table.rows[i + 1].cells[j + 1]
-                    for paragraph in cell.paragraphs:
-                        for run in paragraph.runs:
-                            run.font.size = Pt(9)
-                    word_doc_generator.add_text_to_cell_table(table_name, i + 1, j + 1, val)
-                    shading_elm = parse_xml(r'<w:shd {} w:fill="ABF7B1"/>'.format(nsdecls('w'))) \
-                        if iff['status'] == 'Operational' \
-                        else parse_xml(r'<w:shd {} w:fill="00FFFF"/>'.format(nsdecls('w')))
-                    table.rows[i + 1].cells[j + 1]._tc.get_or_add_tcPr().append(shading_elm)
+    # Loop over the interfaces linking the selected services, and fill the cells corresponding to the row / col
+    for (source_id, target_id), iff in interfaces_by_link.items():
+        for i in positions.get(source_id, []):
+            for j in positions.get(target_id, []):
+                val = '1' if iff['status'] == 'Operational' else '2'
+                word_doc_generator.add_text_to_cell(cells[i][j], val)
+                shading_elm = parse_xml(r'<w:shd {} w:fill="ABF7B1"/>'.format(nsdecls('w'))) \
+                    if iff['status'] == 'Operational' \
+                    else parse_xml(r'<w:shd {} w:fill="00FFFF"/>'.format(nsdecls('w')))
+                cells[i][j]._tc.get_or_add_tcPr().append(shading_elm)
 
     return
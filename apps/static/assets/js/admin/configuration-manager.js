@@ -85,7 +85,7 @@ class ConfigurationManager {
                         '<img class="navbar-brand-light" src="/static/assets/img/icons/database_black_24px.png" alt="Download description document" />' +
                         'Open configuration versioning' +
                     '</a>' +
-                    '<a class="dropdown-item rounded-top" href="/rest/api/interfaces/document/'+configuration['id']+'">' +
+                    '<a class="dropdown-item rounded-top" href="#" onClick="downloadDocument(\'interfaces\', \''+configuration['id']+'\');">' +
                         '<img class="navbar-brand-light" src="/static/assets/img/icons/document-signed.svg" alt="Download description document" />' +
                         'Download description document' +
                     '</a>' +
@@ -133,7 +133,7 @@ class ConfigurationManager {
                         '<img class="navbar-brand-light" src="/static/assets/img/icons/preview_black_24dp.svg" alt="Open configuration" />' +
                         'Edit configuration' +
                     '</a>' +
-                    '<a class="dropdown-item rounded-top" href="/rest/api/services/document/'+configuration['id']+'">' +
+                    '<a class="dropdown-item rounded-top" href="#" onClick="downloadDocument(\'services\', \''+configuration['id']+'\');">' +
                         '<img class="navbar-brand-light" src="/static/assets/img/icons/document-signed.svg" alt="Download description document" />' +
                         'Download description document' +
                     '</a>' +
@@ -33,6 +33,9 @@ class InterfacesViewer {
         // Selected mission
         this.selectedMission = null;
 
+        // Whether the changes of the configuration are followed
+        this.changesListened = false;
+
     }
 
     init() {
@@ -60,6 +63,20 @@ class InterfacesViewer {
 
     }
 
+    initChangesListener(revision) {
+
+        // Follow the changes of the current configuration, if displayed, and apply them to the map
+        var url = new URL(window.location);
+        if (url.searchParams.get('version') || viewer.changesListened) return;
+        viewer.changesListened = true;
+        listenConfigurationChanges(url.searchParams.get('id'), revision || 0, function(changes) {
+            if (!changes.snapshot && !changes.changes['nodes'] && !changes.changes['connections']) return;
+            var graph = applyConfigurationChanges(JSON.parse(viewer.configFlowChart.graph), changes);
+            viewer.configFlowChart.graph = JSON.stringify(graph);
+            viewer.displayInterfaceConfiguration();
+        });
+    }
+
     initCanvas() {
 
         // Reset HTML page
@@ -199,6 +216,13 @@ class InterfacesViewer {
         console.info("Interfaces configuration loaded.");
         viewer.configFlowChart = formatResponse(response)[0];
 
+        // Display the Interface Configuration, and keep it up to date
+        viewer.displayInterfaceConfiguration();
+        viewer.initChangesListener(viewer.configFlowChart.revision);
+    }
+
+    displayInterfaceConfiguration() {
+
         // Fill the entity combo box
         viewer.fillEntitiesLists();
 
@@ -59,6 +59,9 @@ class ProcessorsViewer {
         this.processorsEvents = new vis.DataSet();
         this.filteredEvents = new vis.DataSet();
         this.detailsMap = {};
+
+        // Whether the changes of the configuration are followed
+        this.changesListened = false;
     }
 
     init() {
@@ -69,6 +72,37 @@ class ProcessorsViewer {
 
     }
 
+    initChangesListener(revision) {
+
+        // Follow the changes of the processors releases, and apply them to the timeline
+        var url = new URL(window.location);
+        if (procViewer.changesListened) return;
+        procViewer.changesListened = true;
+        listenConfigurationChanges(url.searchParams.get('id'), revision || 0, function(changes) {
+            var change = changes.snapshot ? {'replaced': changes.graph['processors_releases'] || []} :
+                changes.changes['processors_releases'];
+            if (!change) return;
+            procViewer.processorsReleases = applyConfigurationChanges(
+                {'processors_releases': procViewer.processorsReleases},
+                {'changes': {'processors_releases': change}})['processors_releases'];
+            var releases = change.replaced ? change.replaced : change.added.concat(change.updated);
+            if (change.replaced) {
+                procViewer.processorsEvents.clear();
+                procViewer.detailsMap = {};
+            } else {
+                procViewer.processorsEvents.remove(change.removed);
+                change.removed.forEach(id => delete procViewer.detailsMap[id]);
+            }
+            releases.forEach(pr => {
+                procViewer.processorsEvents.update(procViewer.buildEventInstance(pr));
+                procViewer.detailsMap[pr['id']] = procViewer.buildDetailsPanel(pr);
+            });
+
+            // Refresh the displayed events, applying the current filter
+            procViewer.filterEvents($('#processors-text-filter').val());
+        });
+    }
+
     initProcessorsTimeline() {
 
         // Set the time range of the Timeline
@@ -132,6 +166,9 @@ class ProcessorsViewer {
         // Set the events associated to the processors release of the timeline
         procViewer.timeline.setItems(procViewer.processorsEvents);
 
+        // Keep the processors releases up to date
+        procViewer.initChangesListener(formatResponse(response)[0].revision);
+
         // Set the displayed time range within the last 18 months
         var beg_date = new Date();
         var beg_date_ms = beg_date.getTime() - 548 * 24 * 60 * 60 * 1000;
@@ -45,6 +45,9 @@ class ServicesViewer {
         // Selected satellite
         this.selectedSatellite = null;
 
+        // Whether the changes of the configuration are followed
+        this.changesListened = false;
+
     }
 
     init() {
@@ -66,6 +69,22 @@ class ServicesViewer {
 
     }
 
+    initChangesListener(revision) {
+
+        // Follow the changes of the current configuration, if displayed, and apply them to the diagram
+        var url = new URL(window.location);
+        if (url.searchParams.get('version') || servicesViewer.changesListened) return;
+        servicesViewer.changesListened = true;
+        listenConfigurationChanges(url.searchParams.get('id'), revision || 0, function(changes) {
+            if (!changes.snapshot && !changes.changes['services'] && !changes.changes['interfaces']) return;
+            var graph = applyConfigurationChanges(
+                {'services': servicesViewer.services, 'interfaces': servicesViewer.interfaces}, changes);
+            servicesViewer.services = graph['services'] || [];
+            servicesViewer.interfaces = graph['interfaces'] || [];
+            servicesViewer.displayServicesConfiguration();
+        });
+    }
+
     initFutureInterfacesCheckbox() {
         $('#display-future-interfaces').attr("checked", false);
         $('#display-future-interfaces').change(function() {
@@ -179,6 +198,13 @@ class ServicesViewer {
         servicesViewer.services = JSON.parse(formatResponse(response)[0]['graph'])['services'];
         servicesViewer.interfaces = JSON.parse(formatResponse(response)[0]['graph'])['interfaces'];
 
+        // Display the Services Configuration, and keep it up to date
+        servicesViewer.displayServicesConfiguration();
+        servicesViewer.initChangesListener(formatResponse(response)[0]['revision']);
+    }
+
+    displayServicesConfiguration() {
+
         // Modify the internal interfaces properties so to be suitable for visualization in D3.js
         servicesViewer.services.forEach(node => {
             node['name'] = node['type'] + ' - ' + node['provider'];
@@ -188,7 +214,7 @@ class ServicesViewer {
             iff['target'] = iff['target_service_id'];
         });
 
-        // Display the Services Configuration
+        // Display the Services Diagram
         servicesViewer.displayServicesDiagram();
     }
 
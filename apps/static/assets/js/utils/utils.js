@@ -146,6 +146,112 @@ function sleep(ms) {
   return new Promise(resolve => setTimeout(resolve, ms));
 }
 
+// Listen to the changes of a configuration made after the given revision, streamed by the server as server-sent
+// events: the modified elements are retrieved once for a burst of change notices, and passed to the callback (see
+// /rest/api/configurations/<id>/changes and applyConfigurationChanges). Each open stream holds a server thread, so
+// the stream is opened only while the page is visible, and the server closes it periodically (the browser reconnects
+// automatically, resuming from the last notice).
+function listenConfigurationChanges(configId, revision, callback) {
+    if (typeof EventSource === 'undefined') return;
+    var source = null;
+    var timer = null;
+    var refresh = function() {
+        $.getJSON('/rest/api/configurations/' + configId + '/changes', {since: revision}, function(changes) {
+            if (!changes.snapshot && changes.revision === revision) return;
+            revision = changes.revision;
+            callback(changes);
+        });
+    };
+    var notify = function() {
+        clearTimeout(timer);
+        timer = setTimeout(refresh, 1000);
+    };
+    var toggle = function() {
+        if (document.visibilityState === 'visible' && source == null) {
+            source = new EventSource('/rest/api/configurations/' + configId + '/events?since=' + revision);
+            source.addEventListener('change', notify);
+            source.addEventListener('reset', notify);
+        } else if (document.visibilityState !== 'visible' && source != null) {
+            source.close();
+            source = null;
+        }
+    };
+    document.addEventListener('visibilitychange', toggle);
+    toggle();
+}
+
+// Apply the changes retrieved by listenConfigurationChanges to a configuration graph, i.e. a dictionary of arrays
+// of elements: the updated elements are replaced in place, the removed ones dropped and the added ones appended
+function applyConfigurationChanges(graph, changes) {
+    if (changes.snapshot) return changes.graph;
+    Object.keys(changes.changes).forEach(key => {
+        var change = changes.changes[key];
+        if (change.replaced) {
+            graph[key] = change.replaced;
+            return;
+        }
+        var modified = new Map();
+        change.updated.concat(change.added).forEach(element => modified.set(element.id, element));
+        var removed = new Set(change.removed);
+        var elements = [];
+        (graph[key] || []).forEach(element => {
+            if (removed.has(element.id)) return;
+            if (modified.has(element.id)) {
+                elements.push(modified.get(element.id));
+                modified.delete(element.id);
+                return;
+            }
+            elements.push(element);
+        });
+        modified.forEach(element => elements.push(element));
+        graph[key] = elements;
+    });
+    return graph;
+}
+
+// Download a document generated in the background (see /rest/api/documents/jobs): the generation is requested, the
+// job is polled until completed, and the document is then downloaded
+function downloadDocument(documentType, configId) {
+    var showLoader = function(visible) {
+        if ($('#loaderDiv').length) visible ? $('#loaderDiv').show() : $('#loaderDiv').hide();
+    };
+    var failed = function(message) {
+        showLoader(false);
+        console.error(message);
+        $.notify({title: 'Document generation', message: message, icon: 'fa fa-bell'}, {
+            type: 'danger',
+            placement: {from: 'bottom', align: 'right'},
+            time: 1000,
+            delay: 0
+        });
+    };
+    var follow = function(job) {
+        if (job.status === 'done') {
+            showLoader(false);
+            window.location.href = '/rest/api/documents/jobs/' + job.id + '/document';
+        } else if (job.status === 'failed') {
+            failed('Unable to generate the document: ' + job.error);
+        } else {
+            $.getJSON('/rest/api/documents/jobs/' + job.id, {wait: 3}, follow).fail(function() {
+                failed('Unable to retrieve the status of the document generation');
+            });
+        }
+    };
+    showLoader(true);
+    $.ajax({
+        url: '/rest/api/documents/jobs',
+        type: 'POST',
+        contentType: "application/json; charset=utf-8",
+        dataType: "json",
+        data: JSON.stringify({'type': documentType, 'config_id': configId}),
+        success: follow,
+        error: function(xhr) {
+            failed(xhr.status === 503 ? 'Too many documents are being generated, please retry later' :
+                'Unable to request the generation of the document');
+        }
+    });
+}
+
 function convert_string_datetime_python_to_js(date_string){
     var date = date_string.split('/');
     return new Date(date[1]+'/'+date[0]+'/'+date[2]);
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread-safe, least recently used cache, bounded both in number of entries and in total (estimated) size.
+    Each key has a generation, incremented upon invalidation: a value loaded before an invalidation of its key is not
+    stored, so that a slow reader cannot overwrite the cache with an outdated value.
+    """
+
+    def __init__(self, max_entries, max_size, ttl=0):
+        """
+        :param max_entries: the maximum number of entries
+        :param max_size: the maximum total size of the entries, in the unit of the sizes given to put
+        :param ttl: the time to live of the entries in seconds, or 0 if the entries never expire
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()
+        self.__generations = {}
+        self.__epoch = 0
+        self.__size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self, key):
+        """
+        :param key: the cache key
+        :return: the current generation of the key, to be passed to put once the value is loaded
+        :rtype: tuple
+        """
+        with self.__lock:
+            return self.__epoch, self.__generations.get(key, 0)
+
+    def get(self, key):
+        """
+        :param key: the cache key
+        :return: the cached value, or None if missing or expired
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[2] > self.ttl:
+                self.__remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size, generation=None):
+        """
+        Store a value, evicting the least recently used entries if the cache is full. Values larger than the whole
+        cache, or loaded before the last invalidation of the key, are not stored.
+        :param key: the cache key
+        :param value: the value
+        :param size: the estimated size of the value
+        :param generation: the generation of the key when the value was loaded
+        :return: True if the value has been stored
+        :rtype: bool
+        """
+        with self.__lock:
+            if size > self.max_size or self.max_entries <= 0:
+                return False
+            if generation is not None and generation != (self.__epoch, self.__generations.get(key, 0)):
+                return False
+            self.__remove(key)
+            self.__entries[key] = (value, size, time.monotonic())
+            self.__size += size
+            while len(self.__entries) > self.max_entries or self.__size > self.max_size:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key):
+        with self.__lock:
+            self.__generations[key] = self.__generations.get(key, 0) + 1
+            self.__remove(key)
+
+    def clear(self):
+        with self.__lock:
+            self.__epoch += 1
+            self.__generations.clear()
+            self.__entries.clear()
+            self.__size = 0
+
+    def get_stats(self):
+        with self.__lock:
+            return {
+                'entries': len(self.__entries),
+                'size': self.__size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def __remove(self, key):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__size -= entry[1]
+
+
+class DocumentCache(object):
+    """
+    A content-addressed cache of generated files (e.g. Word documents), stored on disk so that it is shared by all the
+    processes of the host. The cache key is the hash of everything the file is generated from; the least recently
+    used files are evicted once the total size exceeds the limit.
+    """
+
+    def __init__(self, directory, max_size):
+        """
+        :param directory: the directory storing the cached files
+        :param max_size: the maximum total size of the cached files, in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.__hashes = {}
+        self.__lock = threading.Lock()
+
+    def key(self, *parts):
+        """
+        :param parts: the strings identifying the inputs of the generated file
+        :return: the cache key
+        :rtype: str
+        """
+        return hashlib.sha256('\n'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def file_hash(self, path):
+        """
+        :param path: the file path
+        :return: the hash of the file content, or None if the file does not exist; the hash is computed again only if
+            the file is modified
+        :rtype: str
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self.__hashes.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as fd:
+            for chunk in iter(lambda: fd.read(1024 * 1024), b''):
+                digest.update(chunk)
+        self.__hashes[path] = (signature, digest.hexdigest())
+        return digest.hexdigest()
+
+    def directory_hash(self, directory, extension=''):
+        """
+        :param directory: the directory path
+        :param extension: the extension of the files to be considered
+        :return: the hash of the names and contents of the files in the directory
+        :rtype: str
+        """
+        if not os.path.isdir(directory):
+            return None
+        names = sorted(name for name in os.listdir(directory) if name.endswith(extension))
+        return self.key(*[name + ':' + str(self.file_hash(os.path.join(directory, name))) for name in names])
+
+    def get(self, key):
+        """
+        :param key: the cache key
+        :return: the path of the cached file, or None if missing
+        :rtype: str
+        """
+        path = os.path.join(self.directory, key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, source):
+        """
+        Move a generated file into the cache.
+        :param key: the cache key
+        :param source: the path of the generated file
+        :return: the path of the cached file
+        :rtype: str
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, key)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        os.close(fd)
+        shutil.move(source, temp_path)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used files, until the total size of the cache is within the limit.
+        :param keep: the path of a file never to be removed, e.g. the file just put and about to be sent
+        """
+        with self.__lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.startswith('.tmp-') and entry.path != keep:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for mtime, size, path in entries)
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+
+_document_cache = []
+
+
+def get_document_cache():
+    """
+    :return: the cache of the generated documents, configured with the DOCUMENT_CACHE_DIR and DOCUMENT_CACHE_SIZE_MB
+        environment variables
+    :rtype: DocumentCache
+    """
+    if not _document_cache:
+        _document_cache.append(DocumentCache(
+            os.getenv('DOCUMENT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'configuration-tool-documents')),
+            int(os.getenv('DOCUMENT_CACHE_SIZE_MB', 512)) * 1024 * 1024))
+    return _document_cache[0]
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+import gzip
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Extensions of the static files worth compressing
+STATIC_EXTENSIONS = ('.js', '.css', '.html', '.svg', '.json', '.map', '.txt', '.xml', '.ttf', '.eot')
+
+
+def init_app(app):
+    """
+    Enable the negotiated compression of the responses (brotli, if the brotli package is installed, or gzip) and
+    the serving of the precompressed static files. The compression is configured with:
+    - COMPRESSION_ENABLED: 'True' or 'False' (default: 'True')
+    - COMPRESSION_MIN_SIZE: the minimum size of the compressed responses, in bytes (default: 1024)
+    - COMPRESSION_LEVEL: the gzip compression level, from 1 to 9 (default: 6)
+    - COMPRESSION_BROTLI_QUALITY: the brotli compression quality, from 0 to 11 (default: 5)
+    - COMPRESSION_MIMETYPES: comma-separated list of the compressed MIME types (default: JSON, text, JavaScript)
+    :param app: the Flask application
+    """
+    if os.getenv('COMPRESSION_ENABLED', 'True') != 'True':
+        return
+    min_size = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+    level = int(os.getenv('COMPRESSION_LEVEL', 6))
+    quality = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+    mimetypes_list = [mimetype.strip() for mimetype in os.getenv(
+        'COMPRESSION_MIMETYPES',
+        'application/json,application/javascript,text/html,text/css,text/plain,text/javascript,image/svg+xml').split(',')]
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if (response.status_code < 200 or response.status_code >= 300 or response.status_code == 204 or
+                response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers or
+                response.mimetype not in mimetypes_list):
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        encoding = negotiate_encoding()
+        if encoding is None:
+            return response
+
+        response.set_data(brotli.compress(data, quality=quality) if encoding == 'br'
+                          else gzip.compress(data, compresslevel=level))
+        response.headers['Content-Encoding'] = encoding
+
+        # The compressed representation is not byte-identical to the original one: its entity tag is weakened, so
+        # that conditional requests still match it
+        etag, weak = response.get_etag()
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+        return response
+
+    # Serve the precompressed siblings of the static files, if available
+    static_view = app.view_functions['static']
+
+    def static(filename):
+        encoding = negotiate_encoding()
+        if encoding is not None:
+            path = os.path.join(app.static_folder, filename)
+            compressed = path + ('.br' if encoding == 'br' else '.gz')
+            if os.path.isfile(path) and os.path.isfile(compressed) and \
+                    os.path.getmtime(compressed) >= os.path.getmtime(path):
+                response = send_from_directory(app.static_folder, filename + ('.br' if encoding == 'br' else '.gz'),
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+        return static_view(filename=filename)
+
+    app.view_functions['static'] = static
+
+
+def negotiate_encoding():
+    """
+    :return: the preferred content encoding supported by both the client and the server, or None
+    :rtype: str
+    """
+    return request.accept_encodings.best_match(['br', 'gzip'] if brotli is not None else ['gzip'])
+
+
+def compress_static(static_folder, level=9):
+    """
+    Write the precompressed siblings (.gz and, if the brotli package is installed, .br) of the static files which are
+    missing or older than the original files.
+    :param static_folder: the static files folder
+    :param level: the gzip compression level
+    :return: the number of written files
+    :rtype: int
+    """
+    written = 0
+    for root, dirs, files in os.walk(static_folder):
+        for name in files:
+            if not name.endswith(STATIC_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            try:
+                fd = open(path, 'rb')
+            except OSError:
+
+                # The file has been removed meanwhile
+                continue
+            with fd:
+                mtime = os.fstat(fd.fileno()).st_mtime
+                data = None
+                for extension, compress in (('.gz', lambda d: gzip.compress(d, compresslevel=level, mtime=0)),
+                                            ('.br', lambda d: brotli.compress(d, quality=11) if brotli else None)):
+                    compressed = path + extension
+                    if os.path.isfile(compressed) and os.path.getmtime(compressed) >= mtime:
+                        continue
+                    if data is None:
+                        data = fd.read()
+                    content = compress(data)
+                    if content is None or len(content) >= len(data):
+                        continue
+                    with open(compressed, 'wb') as out:
+                        out.write(content)
+                    written += 1
+    return written
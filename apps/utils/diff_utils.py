@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+import copy
+
+
+def diff(old, new, path=None):
+    """
+    Compute the structural difference between two JSON-like values, as a list of operations.
+    Dictionaries are compared key by key; lists whose items are dictionaries with a unique 'id' are compared item
+    by item, addressing each item by its ID; any other changed value is replaced as a whole.
+    Each operation is a dictionary with the fields:
+    - op: 'set' (add or replace the value), 'unset' (remove the key or item) or 'order' (reorder the dictionary
+      keys or the list items, so that the serialization of the patched value is preserved)
+    - path: the list of the keys (for dictionaries) or {'id': <item ID>} (for lists) leading to the value
+    - value: the new value ('set') or the new order of the keys or item IDs ('order')
+    :param old: the previous value
+    :param new: the current value
+    :param path: the path of the compared values
+    :return: the list of operations turning the old value into the new one
+    :rtype: list
+    """
+    if path is None:
+        path = []
+    ops = []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key not in old:
+                ops.append({'op': 'set', 'path': path + [key], 'value': value})
+            else:
+                ops += diff(old[key], value, path + [key])
+        for key in old:
+            if key not in new:
+                ops.append({'op': 'unset', 'path': path + [key]})
+        keys = [key for key in old if key in new] + [key for key in new if key not in old]
+        if keys != list(new):
+            ops.append({'op': 'order', 'path': path, 'value': list(new)})
+    elif isinstance(old, list) and isinstance(new, list) and _is_keyed(old) and _is_keyed(new):
+        old_items = {item['id']: item for item in old}
+        new_ids = [item['id'] for item in new]
+        new_id_set = set(new_ids)
+        for item in new:
+            if item['id'] not in old_items:
+                ops.append({'op': 'set', 'path': path + [{'id': item['id']}], 'value': item})
+            else:
+                ops += diff(old_items[item['id']], item, path + [{'id': item['id']}])
+        kept_ids = [item['id'] for item in old if item['id'] in new_id_set]
+        for item in old:
+            if item['id'] not in new_id_set:
+                ops.append({'op': 'unset', 'path': path + [{'id': item['id']}]})
+        added_ids = [item_id for item_id in new_ids if item_id not in old_items]
+        if kept_ids + added_ids != new_ids:
+            ops.append({'op': 'order', 'path': path, 'value': new_ids})
+    elif not _same(old, new):
+        ops.append({'op': 'set', 'path': path, 'value': new})
+    return ops
+
+
+def patch(value, ops):
+    """
+    Apply the operations computed by diff to a value.
+    :param value: the value to be patched; it is not modified
+    :param ops: the list of operations
+    :return: the patched value
+    """
+    root = {'value': copy.deepcopy(value)}
+    for op in ops:
+        path = ['value'] + op['path']
+        parent = root
+        for key in path[:-1]:
+            parent = _get(parent, key)
+        key = path[-1]
+        if op['op'] == 'set':
+            _set(parent, key, copy.deepcopy(op['value']))
+        elif op['op'] == 'unset':
+            _unset(parent, key)
+        elif op['op'] == 'order':
+            target = _get(parent, key)
+            if isinstance(target, dict):
+                _set(parent, key, {item_key: target[item_key] for item_key in op['value']})
+            else:
+                items = {item['id']: item for item in target}
+                _set(parent, key, [items[item_id] for item_id in op['value']])
+    return root['value']
+
+
+def _same(old, new):
+    if type(old) != type(new):
+        return False
+    if isinstance(old, dict):
+        return list(old) == list(new) and all(_same(old[key], new[key]) for key in old)
+    if isinstance(old, list):
+        return len(old) == len(new) and all(_same(x, y) for x, y in zip(old, new))
+    return old == new
+
+
+def _is_keyed(items):
+    ids = set()
+    for item in items:
+        if not isinstance(item, dict) or 'id' not in item or not isinstance(item['id'], str) or item['id'] in ids:
+            return False
+        ids.add(item['id'])
+    return True
+
+
+def _index(items, key):
+    return next((i for i, item in enumerate(items) if item.get('id') == key['id']), None)
+
+
+def _get(parent, key):
+    if isinstance(key, dict):
+        return parent[_index(parent, key)]
+    return parent[key]
+
+
+def _set(parent, key, value):
+    if isinstance(key, dict):
+        index = _index(parent, key)
+        if index is None:
+            parent.append(value)
+        else:
+            parent[index] = value
+    else:
+        parent[key] = value
+
+
+def _unset(parent, key):
+    if isinstance(key, dict):
+        index = _index(parent, key)
+        if index is not None:
+            del parent[index]
+    else:
+        parent.pop(key, None)
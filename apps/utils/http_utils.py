@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+import datetime
+import hashlib
+import json
+
+from flask import Response, request, stream_with_context
+from werkzeug.http import is_resource_modified
+
+from apps.models.nosql.Graph import RevisionConflict
+from apps.utils.db_utils import AlchemyEncoder
+
+
+def stream_json(items, status=200):
+    """
+    Build a response streaming a JSON array, serializing one item at a time, so that the whole list never needs to
+    be built in memory.
+    :param items: an iterable of JSON serializable items (e.g. a cursor generator)
+    :param status: the HTTP status code
+    :return: the streaming response
+    :rtype: Response
+    """
+    def generate():
+        yield '['
+        for i, item in enumerate(items):
+            if i > 0:
+                yield ','
+            yield json.dumps(item, cls=AlchemyEncoder)
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype="application/json", status=status)
+
+
+def error_response(ex):
+    """
+    Build the error response of a REST request which raised an exception.
+    :param ex: the exception
+    :return: status 409 if the configuration kept being modified concurrently by other requests, 500 otherwise
+    :rtype: Response
+    """
+    if isinstance(ex, RevisionConflict):
+        return Response(json.dumps({'error': '409'}), mimetype="application/json", status=409)
+    return Response(json.dumps({'error': '500'}), mimetype="application/json", status=500)
+
+
+def sse_event(data, event=None, event_id=None):
+    """
+    Format a server-sent event.
+    :param data: the JSON serializable data of the event
+    :param event: the event type, if not the default one ('message')
+    :param event_id: the event ID, sent back by the client in the Last-Event-ID header upon reconnection
+    :return: the event, in the text/event-stream format
+    :rtype: str
+    """
+    lines = []
+    if event_id is not None:
+        lines.append('id: {}'.format(event_id))
+    if event is not None:
+        lines.append('event: {}'.format(event))
+    lines.append('data: ' + json.dumps(data, cls=AlchemyEncoder))
+    return '\n'.join(lines) + '\n\n'
+
+
+def document_etag(document):
+    """
+    Compute the strong entity tag of a Mongo document, from its ID, revision and last modification date, which are
+    updated upon every write.
+    :param document: the document
+    :return: the entity tag
+    :rtype: str
+    """
+    last_modify = document.get('last_modify')
+    key = '{}:{}:{}'.format(document.get('id'), document.get('revision', 0),
+                            last_modify.isoformat() if isinstance(last_modify, datetime.datetime) else last_modify)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def content_etag(content):
+    """
+    :param content: the serialized response body
+    :return: the strong entity tag of the response body
+    :rtype: str
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+def not_modified(etag, last_modified=None):
+    """
+    Evaluate the If-None-Match and If-Modified-Since headers of the current request.
+    :param etag: the entity tag of the current representation of the resource
+    :param last_modified: the last modification date of the resource (naive dates are interpreted as UTC)
+    :return: a 304 response if the client copy is still valid, None otherwise
+    :rtype: Response
+    """
+    last_modified = _utc(last_modified)
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return _set_validators(Response(status=304), etag, last_modified)
+
+
+def conditional_json(payload, etag=None, last_modified=None, status=200):
+    """
+    Build a JSON response carrying the validators of the resource (ETag, Last-Modified), so that the client can
+    revalidate it with a conditional request. If no entity tag is given, it is computed from the response body; in
+    this case, a 304 response is returned if the client copy matches.
+    :param payload: the JSON serializable payload
+    :param etag: the entity tag of the resource
+    :param last_modified: the last modification date of the resource
+    :param status: the HTTP status code
+    :return: the response
+    :rtype: Response
+    """
+    content = json.dumps(payload, cls=AlchemyEncoder)
+    last_modified = _utc(last_modified)
+    if etag is None:
+        etag = content_etag(content)
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+    return _set_validators(Response(content, mimetype="application/json", status=status), etag, last_modified)
+
+
+def document_response(document, content=None, variant=None):
+    """
+    Build the JSON response of a Mongo document, validated with its entity tag and last modification date: a 304
+    response is returned, without serializing the document, if the client copy is still valid.
+    :param document: the document
+    :param content: the serialized document, if already available
+    :param variant: the name of the representation of the document, if not the default one (e.g. 'raw')
+    :return: the response
+    :rtype: Response
+    """
+    etag = document_etag(document) + ('-' + variant if variant else '')
+    last_modified = _utc(document.get('last_modify'))
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    if content is None:
+        return conditional_json(document, etag, last_modified)
+    return _set_validators(Response(content, mimetype="application/json", status=200), etag, last_modified)
+
+
+def _set_validators(response, etag, last_modified):
+    if etag is not None:
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    # The responses depend on the user session: they can be stored by the browser only, and must be revalidated
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _utc(date):
+    if isinstance(date, datetime.datetime) and date.tzinfo is None:
+        return date.replace(tzinfo=datetime.timezone.utc)
+    return date
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Status of the jobs
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobStore(object):
+    """
+    A store of asynchronous jobs, kept on disk as one JSON file per job, so that the jobs are shared by all the
+    processes of the host and outlive the processes which submitted or ran them (e.g. recycled gunicorn workers).
+    Each job records the PID of the process in charge of it: a pending job whose process is gone, or which is pending
+    for longer than the timeout, is considered interrupted.
+    """
+
+    def __init__(self, directory, timeout, ttl):
+        """
+        :param directory: the directory storing the jobs
+        :param timeout: the maximum duration of the pending jobs, in seconds
+        :param ttl: the time to live of the jobs, in seconds
+        """
+        self.directory = directory
+        self.timeout = timeout
+        self.ttl = ttl
+
+    def get(self, job_id):
+        """
+        :param job_id: the job ID
+        :return: the job, or None if not found
+        :rtype: dict
+        """
+        try:
+            with open(os.path.join(self.directory, job_id + '.json')) as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, job):
+        """
+        Atomically store a job, replacing the previous version, if any.
+        :param job: the job, with its 'id'
+        :return: the job
+        :rtype: dict
+        """
+        os.replace(self.__write(job), os.path.join(self.directory, job['id'] + '.json'))
+        return job
+
+    def claim(self, job, replaceable):
+        """
+        Atomically store a new job, unless a job with the same ID is stored and cannot be replaced: among concurrent
+        claims of the same job, exactly one succeeds and the others get the stored job. The first version of a job is
+        created exclusively; the replacement of a version is claimed by exclusively creating a marker of that version,
+        removed once the claim is resolved.
+        :param job: the job, with its 'id'
+        :param replaceable: the function telling whether a stored job can be replaced, e.g. because it failed
+        :return: the stored job, and whether it is the given job
+        :rtype: tuple
+        """
+        path = os.path.join(self.directory, job['id'] + '.json')
+        current = self.get(job['id'])
+        if current is None:
+            job['attempt'] = 1
+            temp_path = self.__write(job)
+            try:
+                os.link(temp_path, path)
+                return job, True
+            except FileExistsError:
+                current = self.get(job['id'])
+            finally:
+                os.remove(temp_path)
+            if current is None:
+
+                # The stored job is unreadable
+                return self.save(job), True
+        if not replaceable(current):
+            return current, False
+
+        job['attempt'] = current.get('attempt', 1) + 1
+        marker = os.path.join(self.directory, '{}.{:.6f}.claim'.format(job['id'], current['updated']))
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+
+            # Another process is replacing the job: wait for it to store the new version, or consider its claim
+            # abandoned after a while
+            replaced = current['updated']
+            deadline = time.monotonic() + 5
+            while current['updated'] == replaced and time.monotonic() < deadline:
+                time.sleep(0.01)
+                current = self.get(job['id']) or current
+            if current['updated'] == replaced:
+                self.__remove(marker)
+            return current, False
+        try:
+
+            # The version may have been replaced before the marker was created, by a claim whose marker is removed
+            latest = self.get(job['id'])
+            if latest is not None and latest['updated'] != current['updated']:
+                return latest, False
+            return self.save(job), True
+        finally:
+            self.__remove(marker)
+
+    @staticmethod
+    def __remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __write(self, job):
+        """
+        :param job: the job
+        :return: the path of a new temporary file of the store, holding the job
+        :rtype: str
+        """
+        job['updated'] = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as temp_file:
+            json.dump(job, temp_file)
+        return temp_path
+
+    def update(self, job_id, **fields):
+        """
+        :param job_id: the job ID
+        :param fields: the fields to be updated
+        :return: the updated job, or None if not found
+        :rtype: dict
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        return self.save(job)
+
+    def is_pending(self, job):
+        """
+        :param job: the job
+        :return: True if the job is queued or running, and not interrupted
+        :rtype: bool
+        """
+        if job['status'] not in (QUEUED, RUNNING) or time.time() - job['updated'] > self.timeout:
+            return False
+        try:
+            os.kill(job['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def purge(self):
+        """
+        Remove the jobs older than the time to live.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and time.time() - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class JobRunner(object):
+    """
+    Run the jobs of a JobStore in a bounded pool of processes, started upon the first submission in each process. The
+    jobs update their own status in the store, so that a running job is completed even if the submitting process
+    exits in the meanwhile.
+    """
+
+    def __init__(self, store, max_workers, max_pending):
+        """
+        :param store: the job store
+        :param max_workers: the number of processes running the jobs
+        :param max_pending: the maximum number of jobs queued or running in the pool
+        """
+        self.store = store
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.__lock = threading.Lock()
+        self.__executor = None
+        self.__pid = None
+        self.__pending = 0
+
+    def submit(self, job, function, *args):
+        """
+        Claim a new job in the store and queue it; the job is run by calling function(*args) in a separate process.
+        If the same job is already pending, it is returned instead. The queued jobs are held by the pool of the
+        submitting process: if the process exits before running them, they are interrupted (see JobStore.is_pending)
+        and shall be submitted again.
+        :param job: the job, with its 'id'
+        :param function: the function, importable by the pool processes
+        :param args: the arguments of the function, which shall be picklable
+        :return: the stored job
+        :rtype: dict
+        """
+        with self.__lock:
+            if self.__pending >= self.max_pending:
+                raise JobQueueFull()
+            if self.__executor is None or self.__pid != os.getpid():
+
+                # The processes are spawned, rather than forked from the multi-threaded web server
+                self.__executor = ProcessPoolExecutor(self.max_workers, multiprocessing.get_context('spawn'))
+                self.__pid = os.getpid()
+            job.update({'status': QUEUED, 'pid': os.getpid(), 'error': None})
+            job, claimed = self.store.claim(job, lambda current: not self.store.is_pending(current))
+            if not claimed:
+                return job
+            try:
+                future = self.__executor.submit(run_job, job['id'], function, args)
+            except Exception as ex:
+
+                # The pool is broken (e.g. a process has been killed): it is replaced upon the next submission
+                self.__executor = None
+                self.store.update(job['id'], status=FAILED, error=str(ex))
+                raise
+            self.__pending += 1
+        future.add_done_callback(lambda result: self.__done(job['id'], result))
+        return job
+
+    def __done(self, job_id, future):
+        with self.__lock:
+            self.__pending -= 1
+            if isinstance(future.exception(), BrokenProcessPool):
+                self.__executor = None
+        if future.exception() is not None:
+
+            # The job could not be run, e.g. its process died
+            self.store.update(job_id, status=FAILED, error=str(future.exception()))
+
+
+def run_job(job_id, function, args):
+    """
+    Run a job in a pool process, recording its status in the store.
+    :param job_id: the job ID
+    :param function: the job function
+    :param args: the arguments of the job function
+    """
+    store = get_job_store()
+    store.update(job_id, status=RUNNING, pid=os.getpid())
+    try:
+        function(*args)
+        store.update(job_id, status=DONE)
+    except Exception as ex:
+        store.update(job_id, status=FAILED, error=str(ex))
+
+
+_job_store = []
+_job_runner = []
+
+
+def get_job_store():
+    """
+    :return: the store of the jobs, configured with the DOCUMENT_JOBS_DIR, DOCUMENT_JOBS_TIMEOUT and
+        DOCUMENT_JOBS_TTL environment variables
+    :rtype: JobStore
+    """
+    if not _job_store:
+        _job_store.append(JobStore(
+            os.getenv('DOCUMENT_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'configuration-tool-jobs')),
+            float(os.getenv('DOCUMENT_JOBS_TIMEOUT', 1200)),
+            float(os.getenv('DOCUMENT_JOBS_TTL', 86400))))
+    return _job_store[0]
+
+
+def get_job_runner():
+    """
+    :return: the runner of the jobs, configured with the DOCUMENT_JOBS_WORKERS and DOCUMENT_JOBS_MAX_PENDING
+        environment variables
+    :rtype: JobRunner
+    """
+    if not _job_runner:
+        _job_runner.append(JobRunner(get_job_store(), int(os.getenv('DOCUMENT_JOBS_WORKERS', 1)),
+                                     int(os.getenv('DOCUMENT_JOBS_MAX_PENDING', 8))))
+    return _job_runner[0]
@@ -29,26 +29,50 @@ __version__ = "1.0.0"
 
 import docx
 from htmldocx import HtmlToDocx
+from htmldocx.h2d import remove_whitespace
 from docx.opc.constants import RELATIONSHIP_TYPE as RT
 from docx import Document
 from docx.enum.dml import MSO_THEME_COLOR_INDEX
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from docx.enum.section import WD_ORIENTATION
 from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
 from docx.shared import Inches, Pt
+from docx.table import _Cell
 
+import copy
+import os
 import tempfile
 
 from docx.text.paragraph import Paragraph
+from docx.text.run import Run
 
 from apps.utils import file_utils
 
 
 class WordGenerator:
+    """
+    Generate Word documents, possibly from a template. The paragraphs of the document body are indexed by their
+    (case-insensitive) text, so that the anchors of the generated sections are found without scanning the document;
+    the index is built upon the first lookup, kept up to date by the methods of this class and corrected upon the
+    lookups for the paragraphs edited through the returned proxies.
+    """
+
+    # The version of the generator, part of the cache key of the generated documents: to be increased whenever a change
+    # of this class alters the generated documents
+    VERSION = 1
+
+    # The font and the background color of the header of the tables
+    TABLE_FONT_NAME = 'Calibri'
+    TABLE_FONT_SIZE = Pt(9)
+    TABLE_HEADER_FILL = 'B3ECF1'
 
     def __init__(self, path_to_document=None):
         self.__document = None
         self.__map = {}
+        self.__index = None
+        self.__parser = None
+        self.__run_properties = {}
         self.create(path_to_document)
         return
 
@@ -61,6 +85,7 @@ class WordGenerator:
             self.__document = Document(path_to_document)
         else:
             self.__document = Document()
+        self.__index = None
         return
 
     def add_title_header(self, title):
@@ -86,6 +111,7 @@ class WordGenerator:
         :rtype:
         """
         self.__map[name] = self.__document.add_heading(name, level)
+        self.__indexed(self.__map[name])
         return self.__map[name]
 
     def add_paragraph(self, name, text):
@@ -98,21 +124,42 @@ class WordGenerator:
         :rtype:
         """
         self.__map[name] = self.__document.add_paragraph(text)
+        self.__indexed(self.__map[name])
         return self.__map[name]
 
     def add_paragraph_before(self, paragraph, text=None, style=None):
-        for index, par in enumerate(self.__document.paragraphs):
-            if par.text.lower() == paragraph.text.lower():
-                added_par = par.insert_paragraph_before(text, style)
-        return None
+        """
+        Insert a paragraph before every paragraph of the document having the same text as the given one.
+        :param paragraph: the anchor paragraph
+        :param text: the text of the new paragraph
+        :param style: the style of the new paragraph
+        :return: the last inserted paragraph, or None if the anchor is not found
+        :rtype: Paragraph
+        """
+        added_par = None
+        for element in self.__lookup(paragraph.text, True):
+            added_par = self.__indexed(Paragraph(element, self.__document._body).insert_paragraph_before(text, style))
+        return added_par
 
     def add_paragraph_after(self, paragraph, text=None, style=None):
-        for index, par in enumerate(self.__document.paragraphs):
-            if par.text.lower() == paragraph.text.lower():
-                next_par = self.__document.paragraphs[index + 1]
-                added_par = next_par.insert_paragraph_before(text, style)
-                return added_par
-        return None
+        """
+        Insert a paragraph right before the body paragraph following the first paragraph of the document having the
+        same text as the given one (i.e. after the tables following the anchor, if any).
+        :param paragraph: the anchor paragraph
+        :param text: the text of the new paragraph
+        :param style: the style of the new paragraph
+        :return: the inserted paragraph, or None if the anchor is not found
+        :rtype: Paragraph
+        """
+        anchors = self.__lookup(paragraph.text)
+        if not anchors:
+            return None
+        next_p = anchors[0].getnext()
+        while next_p is not None and next_p.tag != qn('w:p'):
+            next_p = next_p.getnext()
+        if next_p is None:
+            raise IndexError('No paragraph follows "' + paragraph.text + '"')
+        return self.__indexed(Paragraph(next_p, self.__document._body).insert_paragraph_before(text, style))
 
     def add_picture(self, image_path, paragraph=None, caption=None):
         """
@@ -134,12 +181,13 @@ class WordGenerator:
         if paragraph is None:
             self.__map[image_id] = self.__document.add_picture(image_path, width=Inches(width),
                                                                height=Inches(height))
-            last_paragraph = self.__document.paragraphs[-1]
+            last_paragraph = self.__indexed(Paragraph(self.__document.element.body.p_lst[-1],
+                                                      self.__document._body))
             last_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
         else:
             new_p = OxmlElement("w:p")
             paragraph._p.addnext(new_p)
-            added_par = Paragraph(new_p, paragraph._parent)
+            added_par = self.__indexed(Paragraph(new_p, paragraph._parent))
             run = added_par.add_run()
             self.__map[image_id] = run.add_picture(image_path, width=Inches(width),
                                                    height=Inches(height))
@@ -176,6 +224,7 @@ class WordGenerator:
 
                 # Add text
                 caption_par.add_run(' ' + caption)
+                self.__indexed(caption_par)
 
         return image_id
 
@@ -196,7 +245,7 @@ class WordGenerator:
             paragraph._p.addnext(self.__map[name]._tbl)
         return self.__map[name]
 
-    def add_text_to_cell_table(self, table_name, row, col, text):
+    def add_text_to_cell_table(self, table_name, row, col, text, bold=False):
         """
         :param table_name:
         :type table_name:
@@ -204,20 +253,117 @@ class WordGenerator:
         :type row:
         :param col:
         :type col:
-        :param text:
+        :param text: the cell content, as HTML or plain text
         :type text:
+        :param bold: whether the text is bold
+        :type bold:
         :return:
         :rtype:
         """
-        cell = self.__map[table_name].cell(row, col)
-        parser = HtmlToDocx()
-        parser.add_html_to_cell(text, cell)
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.size = Pt(9)
-                run.font.name = 'Calibri'
+        return self.add_text_to_cell(self.__map[table_name].cell(row, col), text, bold)
+
+    def add_text_to_cell(self, cell, text, bold=False):
+        """
+        :param cell: the empty cell, e.g. retrieved with get_table_cells
+        :type cell: _Cell
+        :param text: the cell content, as HTML or plain text
+        :type text: str
+        :param bold: whether the text is bold
+        :type bold: bool
+        :return: the cell
+        :rtype: _Cell
+        """
+        self.__write_cell(cell, text, bold)
         return cell
 
+    def get_table_cells(self, table_name):
+        """
+        Retrieve all the cells of a table at once, much faster than calling cell() for each one on large tables. The
+        cells are assumed not to be merged.
+        :param table_name: the table name
+        :type table_name: str
+        :return: the cells, row by row
+        :rtype: list
+        """
+        table = self.__map[table_name]
+        return [[_Cell(tc, table) for tc in tr.tc_lst] for tr in table._tbl.tr_lst]
+
+    def write_table(self, name, header, rows, style=None, paragraph=None):
+        """
+        Add a table with a shaded header row and write all the rows at once.
+        :param name: the table name
+        :type name: str
+        :param header: the column titles
+        :type header: list
+        :param rows: the rows, each one as a list of cell contents (HTML or plain text)
+        :type rows: list
+        :param style: the table style
+        :type style: str
+        :param paragraph: the paragraph after which the table is inserted, or None to append it to the document
+        :type paragraph: Paragraph
+        :return: the table
+        :rtype: Table
+        """
+        table = self.add_table(name, len(rows) + 1, len(header), paragraph)
+        if style is not None:
+            table.style = style
+        table.allow_autofit = True
+        cells = self.get_table_cells(name)
+        for title, cell in zip(header, cells[0]):
+            self.__write_cell(cell, title, True)
+            shading = OxmlElement('w:shd')
+            shading.set(qn('w:fill'), self.TABLE_HEADER_FILL)
+            cell._tc.get_or_add_tcPr().append(shading)
+        for values, row_cells in zip(rows, cells[1:]):
+            for value, cell in zip(values, row_cells):
+                self.__write_cell(cell, value)
+        return table
+
+    def __write_cell(self, cell, text, bold=False):
+        """
+        Write the content of an empty table cell, with the table font. Plain text is written as is; any other content
+        is converted from HTML, with a parser shared by all the cells of the document.
+        :param cell: the cell
+        :param text: the cell content, as HTML or plain text
+        :param bold: whether the text is bold
+        """
+        if isinstance(text, str) and '<' not in text and '&' not in text:
+
+            # As the HTML parser does, the initial paragraph of the cell is replaced by a new one; the run is created
+            # with a copy of the final font properties
+            cell._tc.remove(cell._tc.p_lst[0])
+            paragraph = cell.add_paragraph()
+            if text:
+                run = paragraph.add_run(remove_whitespace(text, True, True))
+                run._r.insert(0, copy.deepcopy(self.__table_run_properties(bold)))
+            return
+
+        if self.__parser is None:
+            self.__parser = HtmlToDocx()
+
+        # Drop any incomplete markup left by the previous cell
+        self.__parser.reset()
+        self.__parser.add_html_to_cell(text, cell)
+        for run in [run for paragraph in cell.paragraphs for run in paragraph.runs]:
+            run.font.size = self.TABLE_FONT_SIZE
+            run.font.name = self.TABLE_FONT_NAME
+            if bold:
+                run.font.bold = True
+
+    def __table_run_properties(self, bold):
+        """
+        :param bold: whether the text is bold
+        :return: the run properties (w:rPr element) of the text of the tables
+        """
+        if bold not in self.__run_properties:
+            run = Run(OxmlElement('w:r'), None)
+            run.font.size = self.TABLE_FONT_SIZE
+            run.font.name = self.TABLE_FONT_NAME
+            if bold:
+                run.font.bold = True
+            self.__run_properties[bold] = run._r.rPr
+        return self.__run_properties[bold]
+
     def set_horizontal_layout(self):
         sections = self.__document.sections
         for section in sections:
@@ -227,24 +373,71 @@ class WordGenerator:
             section.page_height = new_height
 
     def get_paragraph(self, paragraph_name):
-        for index, par in enumerate(self.__document.paragraphs):
-            if par.text.lower() == paragraph_name.lower():
-                return par
-        return None
+        """
+        :param paragraph_name: the text of the paragraph, case insensitive
+        :return: the first paragraph of the document body with the given text, or None if not found
+        :rtype: Paragraph
+        """
+        anchors = self.__lookup(paragraph_name)
+        return Paragraph(anchors[0], self.__document._body) if anchors else None
+
+    def __indexed(self, paragraph):
+        """
+        Add a paragraph inserted in the document body to the paragraphs index.
+        :param paragraph: the inserted paragraph
+        :return: the paragraph
+        :rtype: Paragraph
+        """
+        if self.__index is not None and paragraph._p.getparent() is self.__document.element.body:
+            self.__index.setdefault(paragraph.text.lower(), []).append(paragraph._p)
+        return paragraph
+
+    def __lookup(self, text, all_matches=False):
+        """
+        The paragraphs edited through the returned proxies are indexed again upon the lookup of their previous text. A
+        paragraph whose text has been changed to the looked-up one is found by scanning the document upon a miss; if
+        other paragraphs match, it is found once indexed again.
+        :param text: the text of the paragraphs, case insensitive
+        :param all_matches: whether all the matching paragraphs are returned, or the first one only
+        :return: the XML elements of the matching paragraphs of the document body, in document order
+        :rtype: list
+        """
+        body = self.__document.element.body
+        if self.__index is None:
+            self.__index = {}
+            for p in body.iterchildren(qn('w:p')):
+                self.__index.setdefault(Paragraph(p, self.__document._body).text.lower(), []).append(p)
+        key = text.lower()
+        elements = []
+        for p in self.__index.pop(key, []):
+            if p.getparent() is not body:
+                continue
+            current = Paragraph(p, self.__document._body).text.lower()
+            if current == key:
+                elements.append(p)
+            elif p not in self.__index.setdefault(current, []):
+                self.__index[current].append(p)
+        if not elements:
+            elements = [p for p in body.iterchildren(qn('w:p'))
+                        if Paragraph(p, self.__document._body).text.lower() == key]
+        if elements:
+            self.__index[key] = elements
+        if len(elements) > 1:
+            elements.sort(key=body.index)
+        return elements if all_matches else elements[:1]
 
     def set_section_width_height(self, index, width, height):
         section = self.__document.sections[index]
         section.page_width = width
         section.page_height = height
 
-    def save(self, name):
+    def save(self):
         """
-        :param name:
-        :type name:
-        :return:
-        :rtype:
+        Save the document in a new temporary file, so that concurrent generations never share the output file.
+        :return: the path of the saved document
+        :rtype: str
         """
-        path = tempfile.gettempdir()
-        from apps.utils import auth_utils as utils
-        self.__document.save(path + '/' + name + ' - ' + file_utils.get_date_for_file() + '.docx')
-        return path + '/' + name + ' - ' + file_utils.get_date_for_file() + '.docx'
+        fd, path = tempfile.mkstemp(suffix='.docx')
+        os.close(fd)
+        self.__document.save(path)
+        return path
@@ -3,10 +3,15 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
+import os
+
 bind = '0.0.0.0:5005'
 workers = 5 #The suggested number of workers is (2*CPU)+1
-threads = 2
-timeout = 1200
+# Each configuration event stream holds a thread for up to SSE_MAX_DURATION seconds: SSE_MAX_STREAMS threads per worker
+# are reserved to the streams, i.e. to the open viewers, on top of the two threads serving the other requests
+threads = 2 + int(os.getenv('SSE_MAX_STREAMS', 10))
+# The documents are generated by background jobs (see apps/utils/job_utils.py): no request is expected to last long
+timeout = 120
 accesslog = '-'
 loglevel = 'production'
 certfile = '/crt/cert.pem'
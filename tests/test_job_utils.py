@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+""" Configuration Tool
+
+The Configuration Tool is a software program produced for the European Space
+Agency.
+
+The purpose of this tool is to keep under configuration control the changes
+in the Ground Segment components of the Copernicus Programme, in the
+framework of the Coordination Desk Programme, managed by Telespazio S.p.A.
+
+This program is free software: you can redistribute it and/or modify it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License, or (at your option) any later
+version.
+
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Coordination Desk Development Team"
+__contact__ = "coordination_desk@telespazio.com"
+__copyright__ = "Copyright 2024, Telespazio S.p.A."
+__license__ = "GPLv3"
+__status__ = "Production"
+__version__ = "1.0.0"
+
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+from apps.utils.job_utils import JobStore, QUEUED, DONE, FAILED
+
+# Number of processes concurrently claiming the same job
+CLAIMS = 16
+
+
+def claim(directory, status, barrier):
+    """
+    Claim a job, replacing it only if failed, once all the claiming processes are ready.
+    :param directory: the directory of the store
+    :param status: the status of the claimed job
+    :param barrier: the barrier shared by the claiming processes
+    :return: whether the claim succeeded, and the attempt of the stored job
+    :rtype: tuple
+    """
+    store = JobStore(directory, 60, 3600)
+    barrier.wait()
+    job, claimed = store.claim({'id': 'job', 'status': status, 'pid': os.getpid()},
+                               lambda current: current['status'] == FAILED)
+    return claimed, job['attempt']
+
+
+class JobStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = JobStore(self.directory.name, 60, 3600)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def concurrent_claims(self, status):
+        with multiprocessing.Manager() as manager:
+            barrier = manager.Barrier(CLAIMS)
+            with multiprocessing.get_context('spawn').Pool(CLAIMS) as pool:
+                return pool.starmap(claim, [(self.directory.name, status, barrier)] * CLAIMS)
+
+    def test_concurrent_first_claims(self):
+        results = self.concurrent_claims(QUEUED)
+        self.assertEqual(1, sum(claimed for claimed, _ in results))
+        self.assertEqual({1}, {attempt for _, attempt in results})
+        self.assertEqual(['job.json'], os.listdir(self.directory.name))
+
+    def test_concurrent_replacements(self):
+        self.store.claim({'id': 'job', 'status': FAILED, 'pid': os.getpid()}, lambda current: True)
+        results = self.concurrent_claims(QUEUED)
+        self.assertEqual(1, sum(claimed for claimed, _ in results))
+        self.assertEqual(2, self.store.get('job')['attempt'])
+        self.assertEqual(QUEUED, self.store.get('job')['status'])
+
+        # The claim markers are removed once the claims are resolved
+        self.assertEqual(['job.json'], os.listdir(self.directory.name))
+
+    def test_claim_not_replaceable(self):
+        self.store.claim({'id': 'job', 'status': DONE, 'pid': os.getpid()}, lambda current: True)
+        job, claimed = self.store.claim({'id': 'job', 'status': QUEUED, 'pid': os.getpid()},
+                                        lambda current: current['status'] == FAILED)
+        self.assertFalse(claimed)
+        self.assertEqual(DONE, job['status'])
+        self.assertEqual(['job.json'], os.listdir(self.directory.name))
+
+    def test_abandoned_claim(self):
+        job, _ = self.store.claim({'id': 'job', 'status': FAILED, 'pid': os.getpid()}, lambda current: True)
+        marker = os.path.join(self.directory.name, '{}.{:.6f}.claim'.format(job['id'], job['updated']))
+        open(marker, 'w').close()
+        started = time.monotonic()
+        _, claimed = self.store.claim({'id': 'job', 'status': QUEUED, 'pid': os.getpid()}, lambda current: True)
+        self.assertFalse(claimed)
+        self.assertGreaterEqual(time.monotonic() - started, 5)
+        self.assertFalse(os.path.exists(marker))
+
+        # The version can be replaced once the abandoned claim is removed
+        job, claimed = self.store.claim({'id': 'job', 'status': QUEUED, 'pid': os.getpid()}, lambda current: True)
+        self.assertTrue(claimed)
+        self.assertEqual(2, job['attempt'])
+
+    def test_interrupted_job(self):
+        process = multiprocessing.get_context('spawn').Process(target=time.sleep, args=(0,))
+        process.start()
+        process.join()
+        job, _ = self.store.claim({'id': 'job', 'status': QUEUED, 'pid': process.pid}, lambda current: True)
+        self.assertFalse(self.store.is_pending(job))
+        job, _ = self.store.claim({'id': 'job', 'status': QUEUED, 'pid': os.getpid()}, lambda current: True)
+        self.assertTrue(self.store.is_pending(job))
+
+
+if __name__ == '__main__':
+    unittest.main()